@@ -0,0 +1,180 @@
+import os
+import time
+import argparse
+import tempfile
+from typing import Any, Callable, Iterator, List
+
+import yaml
+
+from html_generators.generate_list import (  # type: ignore[import]
+    IdRegistry,
+    Source,
+    load_sources,
+    fetch_anilist_sources,
+)
+from html_generators.mal_name import Cache, Crawl, Names  # type: ignore[import]
+from html_generators.anilist_names import AniListNames  # type: ignore[import]
+from html_generators import ratelimit  # type: ignore[import]
+from html_generators.templates import ROW_RENDERERS  # type: ignore[import]
+from html_generators.generate_people_list import Person  # type: ignore[import]
+from html_generators import constants  # type: ignore[import]
+from html_generators.sources import (  # type: ignore[import]
+    FullLoader,
+    load_models,
+    read_snapshot,
+    read_yaml,
+    validate_models,
+)
+from mock_api import MockAPI, Options  # type: ignore[import]
+
+# render: compares the row renderers (see html_generators/templates.py) on
+# the real list and on larger synthetic lists made by repeating it
+# sources: compares loading the YAML sources cold, from the snapshot
+# and revalidating after an edit
+# fetch: downloads names from a local server (see mock_api.py), which can be
+# made slow or to fail, to measure throughput/backoff
+
+
+def synthetic(sources: List[Source], count: int) -> Iterator[Source]:
+    for i in range(count):
+        s = sources[i % len(sources)].copy()
+        s.name = f"{s.name} #{i}"
+        yield s
+
+
+def timed(func: Callable[[], Any]) -> "tuple[float, Any]":
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def bench_render(sizes: List[int]) -> None:
+    sources = fetch_anilist_sources(load_sources())
+    mal_names = Names.load()
+    lists = [("list_sources.yaml", sources)] + [
+        (f"synthetic {n}", list(synthetic(sources, n))) for n in sizes
+    ]
+    for label, srcs in lists:
+        print(f"{label} ({len(srcs)} entries)")
+        outputs = {}
+        # like render_rows, every id is registered before the rows are rendered
+        ids = IdRegistry(srcs)
+        for name, create in ROW_RENDERERS.items():
+            took, rows = timed(lambda: [create(s, mal_names, True, ids) for s in srcs])
+            outputs[name] = rows
+            print(f"  {name:>10}: {took:.3f}s ({took / len(srcs) * 1e6:.1f}us/row)")
+        first, *rest = outputs.values()
+        assert all(r == first for r in rest), "renderers produced different markup"
+
+
+def bench_sources(repeat: int) -> None:
+    for path, model in (
+        (constants.LIST_SOURCES, Source),
+        (constants.PEOPLE_SOURCES, Person),
+    ):
+        print(path)
+        load_models(path, model)  # make sure the snapshot exists
+        previous = read_snapshot(path)
+        edited = read_yaml(path)
+        edited[0]["name"] += " (edited)"
+        runs = {
+            "cold, pure python loader": lambda: [
+                model.parse_obj(m) for m in read_yaml(path, yaml.FullLoader)
+            ],
+            f"cold, {FullLoader.__name__}": lambda: load_models(
+                path, model, use_snapshot=False
+            ),
+            "warm, from snapshot": lambda: load_models(path, model),
+            "one entry edited, incremental": lambda: validate_models(
+                edited, model, previous
+            )[0],
+            "one entry edited, strict": lambda: validate_models(
+                edited, model, previous, strict=True
+            )[0],
+        }
+        for label, func in runs.items():
+            took = min(timed(func)[0] for _ in range(repeat))
+            print(f"  {label:>30}: {took * 1000:.1f}ms")
+
+
+def bench_fetch(
+    count: int,
+    concurrency: int,
+    rps: float,
+    latency: float,
+    rate_limit_every: int,
+    fail_rate: float,
+) -> None:
+    server = MockAPI(
+        options=Options(
+            latency=latency,
+            rate_limit_every=rate_limit_every,
+            retry_after=0.5,
+            fail_rate=fail_rate,
+        )
+    ).start()
+    ratelimit.HOST_LIMITS["127.0.0.1"] = (rps, max(1, int(rps)))
+    ids = list(range(1, count + 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        mal_cache = Cache(
+            Crawl(wait=0.1, base=server.jikan_url),
+            concurrency,
+            jsonpath=os.path.join(tmp, "mal.json"),
+            metapath=os.path.join(tmp, "mal.meta.json"),
+        )
+        took, failed = timed(lambda: mal_cache.fetch_many(ids))
+        print(
+            f"MAL names: {count} in {took:.2f}s ({count / took:.1f}/s), "
+            f"{len(failed)} failed"
+        )
+        anilist = AniListNames(
+            server.anilist_url,
+            jsonpath=os.path.join(tmp, "anilist.json"),
+            metapath=os.path.join(tmp, "anilist.meta.json"),
+        )
+        took, _ = timed(lambda: anilist.fetch_many(ids))
+        print(f"AniList URLs: {len(anilist.data)} of {count} in {took:.2f}s")
+        mal_cache.update_json_file()
+        anilist.write()
+    server.shutdown()
+    print(f"server: {server.stats}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="benchmark the html generators")
+    sub = parser.add_subparsers(dest="command", required=True)
+    render = sub.add_parser("render", help="compare the row renderers")
+    render.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=[10_000, 100_000],
+        help="sizes of the synthetic lists",
+    )
+    source = sub.add_parser("sources", help="time loading the sources")
+    source.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    fetch = sub.add_parser("fetch", help="time downloading names from mock_api.py")
+    fetch.add_argument("--count", type=int, default=200, help="number of ids")
+    fetch.add_argument("--concurrency", type=int, default=3)
+    fetch.add_argument("--rps", type=float, default=20, help="requests per second")
+    fetch.add_argument("--latency", type=float, default=0.05, help="per request")
+    fetch.add_argument("--rate-limit-every", type=int, default=0, metavar="N")
+    fetch.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    if args.command == "render":
+        bench_render(args.sizes)
+    elif args.command == "sources":
+        bench_sources(args.repeat)
+    elif args.command == "fetch":
+        bench_fetch(
+            args.count,
+            args.concurrency,
+            args.rps,
+            args.latency,
+            args.rate_limit_every,
+            args.fail_rate,
+        )
+
+
+if __name__ == "__main__":
+    main()
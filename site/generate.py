@@ -1,5 +1,3 @@
-from html_generators.generate_list import main  # type: ignore[import]
-from html_generators.generate_people_list import main as pmain  # type: ignore[import]
+from html_generators.build import main  # type: ignore[import]
 
 main()
-pmain()
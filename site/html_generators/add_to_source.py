@@ -7,6 +7,7 @@ from typing import List, Any
 from datetime import date
 from .constants import LIST_SOURCES
 from .generate_list import Source
+from .sources import read_yaml, read_snapshot, validate_models
 
 from pydantic.error_wrappers import ValidationError as PydanticValidationError
 
@@ -74,8 +75,7 @@ def prompt_source() -> Source:
 
 
 def add_source_to_file() -> None:
-    with open(LIST_SOURCES) as yaml_src:
-        sources_raw: List[Any] = yaml.load(yaml_src, Loader=yaml.FullLoader)
+    sources_raw: List[Any] = read_yaml(LIST_SOURCES)
 
     obj = prompt_source()
     click.echo(f"Source item count: {len(sources_raw)}")
@@ -86,6 +86,8 @@ def add_source_to_file() -> None:
             index = itxt
 
     sources_raw.insert(index, json.loads(obj.json()))
+    # make sure the whole file is still valid before writing it
+    validate_models(sources_raw, Source, read_snapshot(LIST_SOURCES))
 
     dataf = io.StringIO()
     yaml.dump(sources_raw, dataf)
@@ -1,42 +1,141 @@
+import argparse
 import sys
-import json
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional, Set
 
-import time
 import requests
 
-from . import constants
+from . import constants, ratelimit
+from .journal import JournalStore
+from .freshness import DAY, Freshness, meta_path
+
+# most entries AniList returns in one page
+BATCH_SIZE = 50
+# times to try a batch which was rate limited or failed on AniList's end
+RETRY_MAX = 3
+QUERY = """query($ids: [Int], $perPage: Int){Page(perPage: $perPage){media(idMal_in: $ids, type: ANIME){idMal siteUrl}}}"""
 
 
 class AniListNames(object):
-    def __init__(self) -> None:
-        self.jsonpath = Path(constants.this_dir).parent / "anilist_cache.json"
-        self.data: Dict[str, Optional[str]] = {}
-        if self.jsonpath.exists():
-            self.data = json.loads(self.jsonpath.read_text())
-        self.write()
+    """
+    Caches the AniList URL for each MAL id
+    args:
+        url: the AniList GraphQL API to use
+        jsonpath: file the URLs are kept in
+        metapath: file when each URL was fetched is kept in
+    """
+
+    def __init__(
+        self,
+        url: str = constants.ANILIST_URL,
+        jsonpath: str = constants.ANILIST_CACHE,
+        metapath: Optional[str] = None,
+    ) -> None:
+        self.url = url
+        self.jsonpath = Path(jsonpath)
+        self.store = JournalStore(self.jsonpath, sort_keys=True)
+        self.data: Dict[str, Optional[str]] = self.store.data
+        # ids whose request failed, not retried until the next run
+        self.failed: Set[int] = set()
+        # check for ids which weren't on AniList more often than ones which were
+        self.freshness = Freshness(
+            metapath or meta_path(jsonpath),
+            ttl=365 * DAY,
+            negative_ttl=14 * DAY,
+            budget=BATCH_SIZE,
+        )
+        self.freshness.adopt(self.data)
+        # reuse the connection between batches
+        self.session = requests.Session()
 
     def write(self) -> None:
-        self.jsonpath.write_text(json.dumps(self.data, indent=4, sort_keys=True))
-
-    def fetch(self, mal_id: int) -> Optional[str]:
-        query = """query($id: Int, $type: MediaType){Media(idMal: $id, type: $type){siteUrl}}"""
-        variables = {"id": mal_id, "type": "ANIME"}
-        url = "https://graphql.anilist.co"
-        time.sleep(1)
-        print(f"Requesting Anilist ID for {mal_id}", file=sys.stderr)
-        response = requests.post(url, json={"query": query, "variables": variables})
-        if response.status_code > 400:
+        """Makes sure every fetched URL is saved"""
+        self.store.sync()
+        self.freshness.sync()
+
+    def fetch_batch(self, mal_ids: List[int]) -> Optional[Dict[int, str]]:
+        """
+        Requests the AniList URLs for up to BATCH_SIZE MAL ids at once.
+        Returns None if the request failed
+        """
+        variables = {"ids": mal_ids, "perPage": BATCH_SIZE}
+        limiter = ratelimit.bucket(self.url)
+        print(f"Requesting Anilist IDs for {len(mal_ids)} MAL IDs", file=sys.stderr)
+        for _ in range(RETRY_MAX):
+            limiter.acquire()
+            try:
+                response = self.session.post(
+                    self.url, json={"query": QUERY, "variables": variables}, timeout=30
+                )
+            except requests.exceptions.RequestException as e:
+                print(f"AniList request failed: {e}", file=sys.stderr)
+                return None
+            limiter.observe(response.status_code, response.headers)
+            # the limiter waits out Retry-After before the next attempt
+            if response.status_code != 429 and response.status_code < 500:
+                break
+        if response.status_code >= 400:
+            print(f"AniList request failed: {response.status_code}", file=sys.stderr)
             return None
-        data = response.json()
-        return str(data["data"]["Media"]["siteUrl"])
+        found: Dict[int, str] = {}
+        for media in response.json()["data"]["Page"]["media"]:
+            found.setdefault(int(media["idMal"]), str(media["siteUrl"]))
+        return found
+
+    def fetch_many(self, mal_ids: Iterable[int], refresh: bool = True) -> None:
+        """
+        Resolves any of mal_ids which aren't cached, BATCH_SIZE per request
+
+        If refresh is set, also re-requests the stale ids in mal_ids,
+        up to the refresh budget
+        """
+        ids = {int(m) for m in mal_ids} - self.failed
+        missing = sorted(m for m in ids if str(m) not in self.data)
+        if refresh:
+            missing.extend(
+                int(k) for k in self.freshness.take(map(str, ids), self.data)
+            )
+        for i in range(0, len(missing), BATCH_SIZE):
+            batch = missing[i : i + BATCH_SIZE]
+            found = self.fetch_batch(batch)
+            if found is None:
+                self.failed.update(batch)  # try these again next time
+                continue
+            for mal_id in batch:
+                # ids not in the response aren't on AniList
+                url = found.get(mal_id)
+                if str(mal_id) not in self.data or self.data[str(mal_id)] != url:
+                    self.store[str(mal_id)] = url
+                self.freshness.stamp(str(mal_id))
+        self.write()
 
     def get(self, mal_id: int) -> Optional[str]:
-        sm = str(mal_id)
-        if sm in self.data:
-            return self.data[sm]
-        else:
-            self.data[sm] = self.fetch(mal_id)
-            self.write()
-            return self.data[sm]
+        self.fetch_many([mal_id], refresh=False)
+        return self.data.get(str(mal_id))
+
+
+def remove_null(jsonpath: str = constants.ANILIST_CACHE) -> int:
+    """
+    Removes the ids which weren't on AniList from the cache (snapshot and
+    journal), so they're requested again. Returns how many were removed
+    """
+    store = JournalStore(jsonpath, sort_keys=True)
+    missing = [k for k, v in store.data.items() if v is None]
+    for k in missing:
+        del store.data[k]
+    # the journal would add them back on the next load
+    store.compact()
+    store.close()
+    return len(missing)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="remove the MAL ids which weren't on AniList from the AniList cache"
+    )
+    parser.parse_args()
+    print(f"Removed {remove_null()} null entries from {constants.ANILIST_CACHE}")
+
+
+if __name__ == "__main__":
+    main()
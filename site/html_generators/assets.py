@@ -0,0 +1,149 @@
+import os
+import re
+import gzip
+import json
+import shutil
+from pathlib import Path
+from hashlib import sha256
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+try:
+    import brotli  # type: ignore[import]
+except ImportError:
+    brotli = None
+
+from . import constants
+
+# post-build steps for serving the site with long lived caching:
+#
+# every asset (css/images/js/resized) is copied to ./assets/<dir>/<name>.<hash>.<ext>,
+# and the references to it in the pages are rewritten, so the copies never
+# change and can be cached forever. The pages and text assets then get .gz
+# (and, if brotli is installed, .br) siblings at maximum compression, for
+# nginx's gzip_static/brotli_static. See the nginx snippet in the README
+
+ASSET_DIRS = ("css", "images", "js", "resized")
+ASSETS = "assets"
+COMPRESS = (".html", ".css", ".js", ".json", ".svg")
+# which files have been compressed, by their sha256
+COMPRESSED_MANIFEST = os.path.join(constants.CACHE_DIR, "compressed.json")
+
+HASH_LENGTH = 10
+# a reference to an asset in a page, or to its fingerprinted copy
+REFERENCE = re.compile(
+    r"\./(?:{}/)?((?:{})/[^\"'\s,)]+)".format(ASSETS, "|".join(ASSET_DIRS))
+)
+FINGERPRINT = re.compile(r"\.[0-9a-f]{%d}(?=\.[^./]+$)" % HASH_LENGTH)
+
+
+def fingerprinted(relpath: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(relpath)
+    return f"{stem}.{sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def fingerprint(output_dir: str = constants.OUTPUT_DIR) -> Dict[str, str]:
+    """
+    Copies each asset to its fingerprinted name under ./assets, and removes
+    copies of assets which changed. Returns {asset: fingerprinted asset},
+    relative to output_dir
+    """
+    out = Path(output_dir)
+    assets_dir = out / ASSETS
+    names: Dict[str, str] = {}
+    for d in ASSET_DIRS:
+        for f in sorted((out / d).rglob("*")):
+            if not f.is_file() or f.suffix in (".gz", ".br"):
+                continue
+            rel = f.relative_to(out).as_posix()
+            names[rel] = fingerprinted(rel, f.read_bytes())
+            dest = assets_dir / names[rel]
+            if not dest.exists():
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(f, dest)
+    wanted = set(names.values())
+    for copy in list(assets_dir.rglob("*")) if assets_dir.exists() else []:
+        # compare .gz/.br files by the file they're a copy of
+        original = copy.relative_to(assets_dir).with_suffix(
+            "" if copy.suffix in (".gz", ".br") else copy.suffix
+        )
+        if copy.is_file() and original.as_posix() not in wanted:
+            copy.unlink()
+    return names
+
+
+def rewrite_references(page: Path, names: Dict[str, str]) -> bool:
+    """Points the asset references in page at the fingerprinted copies"""
+
+    def replace(match: "re.Match[str]") -> str:
+        asset = FINGERPRINT.sub("", match.group(1))
+        if asset not in names:
+            return match.group(0)
+        return f"./{ASSETS}/{names[asset]}"
+
+    html = page.read_text()
+    rewritten = REFERENCE.sub(replace, html)
+    if rewritten == html:
+        return False
+    page.write_text(rewritten)
+    return True
+
+
+def compress(path: str) -> Tuple[str, int, int]:
+    """Writes path.gz (and path.br), runs in a worker process. Returns (path, size, compressed size)"""
+    data = Path(path).read_bytes()
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    Path(f"{path}.gz").write_bytes(gz)
+    smallest = len(gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        Path(f"{path}.br").write_bytes(br)
+        smallest = min(smallest, len(br))
+    return path, len(data), smallest
+
+
+def precompress(
+    output_dir: str = constants.OUTPUT_DIR,
+    manifest_path: str = COMPRESSED_MANIFEST,
+    jobs: int = 0,
+) -> List[Tuple[str, int, int]]:
+    """
+    Compresses each page/text asset in output_dir which changed since it
+    was last compressed, and removes .gz/.br files of deleted files
+    """
+    manifest: Dict[str, str] = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as mf:
+            manifest = json.load(mf)
+    files = sorted(str(f) for f in Path(output_dir).rglob("*") if f.suffix in COMPRESS)
+    todo = []
+    current: Dict[str, str] = {}
+    for f in files:
+        current[f] = sha256(Path(f).read_bytes()).hexdigest()
+        siblings = [f"{f}.gz"] + ([f"{f}.br"] if brotli is not None else [])
+        if manifest.get(f) != current[f] or not all(map(os.path.exists, siblings)):
+            todo.append(f)
+    for p in Path(output_dir).rglob("*"):
+        if p.suffix in (".gz", ".br") and not p.with_suffix("").exists():
+            p.unlink()
+    results = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            results = list(pool.map(compress, todo))
+    Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w") as mf:
+        json.dump(current, mf, indent=4, sort_keys=True)
+    return results
+
+
+def post_build(output_dir: str = constants.OUTPUT_DIR, jobs: int = 0) -> None:
+    names = fingerprint(output_dir)
+    pages = sorted(Path(output_dir).glob("*.html"))
+    rewritten = sum(rewrite_references(p, names) for p in pages)
+    print(f"Fingerprinted {len(names)} assets, rewrote {rewritten} pages")
+    if brotli is None:
+        print("brotli isn't installed, only writing .gz files")
+    results = precompress(output_dir, jobs=jobs)
+    before = sum(r[1] for r in results)
+    after = sum(r[2] for r in results)
+    print(f"Compressed {len(results)} files, {before} -> {after} bytes")
@@ -0,0 +1,564 @@
+import io
+import os
+import re
+import glob
+import json
+import time
+import pickle
+import shutil
+import argparse
+from pathlib import Path
+from hashlib import sha256
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+)
+
+from . import constants
+from .journal import journal_path
+from .image_variants import VARIANTS_DIR
+from .generate_list import Tag, tag_page
+from .search_index import SEARCH_DIR
+
+# builds the site as a graph of stages. each stage declares the files
+# it reads and writes; a stage runs after every stage that writes one of
+# its inputs, and is skipped if its inputs haven't changed since it last ran
+
+SITE_DIR = Path(constants.this_dir).parent
+CODE_DIR = str(SITE_DIR / "html_generators")
+STATIC_DIR = SITE_DIR / "static"
+STAMPS = os.path.join(constants.CACHE_DIR, "build_stamps.json")
+
+# intermediate files passed between stages
+SOURCES_PICKLE = os.path.join(constants.CACHE_DIR, "sources.pickle")
+ENRICHED_PICKLE = os.path.join(constants.CACHE_DIR, "enriched.pickle")
+ROWS_PICKLE = os.path.join(constants.CACHE_DIR, "rows.pickle")
+
+MAL_CACHE = constants.MAL_NAME_CACHE
+ANILIST_CACHE = constants.ANILIST_CACHE
+MAL_JOURNAL = str(journal_path(MAL_CACHE))
+ANILIST_JOURNAL = str(journal_path(ANILIST_CACHE))
+
+
+def _dump(path: str, obj: Any) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load(path: str) -> Any:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _output(filename: str) -> str:
+    return os.path.join(constants.OUTPUT_DIR, filename)
+
+
+# the pages after the first when the list is paginated, see _write_list.
+# Stage inputs/outputs can be globs like these
+INDEX_PAGES = _output("index-*.html")
+NEWEST_PAGES = _output("newest-*.html")
+
+
+class Options(NamedTuple):
+    """Build options, passed to every stage"""
+
+    # which row/card renderer to use, see templates.py
+    renderer: str = "yattag"
+    # indent the pages, instead of writing them out on as few lines as possible
+    pretty: bool = True
+    # validate every source, instead of only the ones which changed
+    strict: bool = False
+    # strip comments and collapse whitespace in the pages. They're rendered
+    # indented first, the unindented render has no space between text and
+    # the inline tags after it
+    minify: bool = False
+    # split the list into pages of this many shorts, 0 for a single page
+    page_size: int = 0
+
+
+# stages; these run in worker processes, so have to be module level functions
+
+
+def load_sources(options: Options) -> None:
+    from .generate_list import load_sources
+
+    _dump(SOURCES_PICKLE, load_sources(options.strict))
+
+
+def enrich_names(options: Options) -> None:
+    from .generate_list import enrich_sources
+    from .mal_name import Cache
+    from .anilist_names import AniListNames
+
+    cache = Cache()
+    _dump(ENRICHED_PICKLE, enrich_sources(_load(SOURCES_PICKLE), cache, True))
+    # the caches are checked in and the journals aren't, so merge every
+    # name fetched by this build into the caches
+    cache.store.merge_journal()
+    AniListNames().store.merge_journal()
+
+
+def render_rows(options: Options) -> None:
+    from .generate_list import render_rows, report_missing, ROW_LEVEL
+    from .mal_name import Names
+    from .fragment_cache import FragmentCache
+    from .templates import ROW_RENDERERS
+
+    mal_names = Names.load()
+    fragments = FragmentCache()
+    rows = render_rows(
+        _load(ENRICHED_PICKLE),
+        mal_names,
+        True,
+        fragments,
+        ROW_RENDERERS[options.renderer],
+        level=ROW_LEVEL if options.pretty else None,
+    )
+    print(f"Rendered {fragments.misses} rows, reused {fragments.hits} cached rows")
+    report_missing(mal_names)
+    fragments.write()
+    _dump(ROWS_PICKLE, rows)
+
+
+def _write_page(
+    filename: str, options: Options, write: Callable[[TextIO], None]
+) -> None:
+    """Writes a page to the output directory, minifying it if asked to"""
+    with open(_output(filename), "w") as f:
+        if not options.minify:
+            write(f)
+            return
+        from .html_writer import minify
+
+        buf = io.StringIO()
+        write(buf)
+        html = buf.getvalue()
+        minified = minify(html)
+        f.write(minified)
+    before, after = len(html.encode()), len(minified.encode())
+    print(
+        f"{filename}: minified {before} -> {after} bytes "
+        f"(saved {before - after}, {(before - after) / before:.1%})"
+    )
+
+
+def _write_list(first: str, list_order: constants.Order, options: Options) -> None:
+    """Writes the list in list_order, split into pages if options.page_size is set"""
+    from .generate_list import paginate, write_page
+
+    rows = _load(ROWS_PICKLE)
+    # remove the pages from the last build, there may be fewer now
+    for old in Path(constants.OUTPUT_DIR).glob(f"{first}-*.html"):
+        if re.fullmatch(rf"{first}-\d+\.html", old.name):
+            old.unlink()
+    if not options.page_size:
+        _write_page(
+            f"{first}.html",
+            options,
+            lambda f: write_page(f, rows, list_order, options.pretty),
+        )
+        return
+    pages = paginate(rows, list_order, options.page_size)
+    for page in pages:
+        _write_page(
+            f"{page.name}.html",
+            options,
+            lambda f: write_page(f, rows, list_order, options.pretty, page=page),
+        )
+    print(f"Split {first}.html into {len(pages)} pages")
+
+
+def render_index(options: Options) -> None:
+    _write_list("index", constants.Order.REC, options)
+
+
+def render_newest(options: Options) -> None:
+    _write_list("newest", constants.Order.DATE, options)
+
+
+def render_tag_pages(options: Options) -> None:
+    from .generate_list import write_page
+
+    rows = _load(ROWS_PICKLE)
+    for t in Tag:
+        for order in constants.Order:
+            _write_page(
+                f"{tag_page(t, order)}.html",
+                options,
+                lambda f: write_page(f, rows, order, options.pretty, only=t),
+            )
+
+
+def search_index(options: Options) -> None:
+    from .generate_list import IdRegistry, paginate, row_id
+    from .mal_name import Names
+    from .search_index import build_index, write_index
+
+    sources = _load(ENRICHED_PICKLE)
+    pages = {}
+    if options.page_size:
+        ids = IdRegistry(sources)
+        rows = [(s, "") for s in sources]
+        for page in paginate(rows, constants.Order.REC, options.page_size):
+            pages.update({row_id(s, ids): page.name for s, _ in page.rows})
+    files = build_index(sources, Names.load(), pages)
+    written, unchanged = write_index(files)
+    print(f"Search index: wrote {written} files, {unchanged} unchanged")
+
+
+def index_images(options: Options) -> None:
+    from .generate_people_list import load_people, update_image_index
+
+    update_image_index(load_people(options.strict))
+
+
+def render_people(options: Options) -> None:
+    from .generate_people_list import load_people, write_people_page
+    from .templates import CARD_RENDERERS
+
+    people = load_people(options.strict)
+    _write_page(
+        "people.html",
+        options,
+        lambda f: write_people_page(
+            f, people, CARD_RENDERERS[options.renderer], options.pretty
+        ),
+    )
+
+
+def resize_images(options: Options) -> None:
+    from .generate_people_list import image_index, load_people
+    from .image_variants import build_variants
+
+    index = image_index()
+    images = sorted({p.image for p in load_people(options.strict)})
+    resized, skipped = build_variants(images, index)
+    print(f"Resized {resized} images, {skipped} unchanged")
+
+
+def copy_assets(options: Options) -> None:
+    for static in ("css", "images", "js"):
+        dest = _output(static)
+        if os.path.exists(dest):
+            shutil.rmtree(dest)
+        shutil.copytree(STATIC_DIR / static, dest)
+
+
+def post_build(options: Options) -> None:
+    from .assets import post_build
+
+    post_build()
+
+
+# the pages listing a single tag, see render_tag_pages
+TAG_PAGES = [
+    _output(f"{tag_page(t, order)}.html") for t in Tag for order in constants.Order
+]
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[Options], None]
+    inputs: List[str]
+    outputs: List[str]
+    # inputs the stage writes to itself (e.g. the name caches)
+    updates: Sequence[str] = ()
+
+
+STAGES: List[Stage] = [
+    Stage(
+        "load sources",
+        load_sources,
+        [constants.LIST_SOURCES, CODE_DIR],
+        [SOURCES_PICKLE],
+    ),
+    Stage(
+        "enrich names",
+        enrich_names,
+        [
+            SOURCES_PICKLE,
+            ANILIST_CACHE,
+            ANILIST_JOURNAL,
+            MAL_CACHE,
+            MAL_JOURNAL,
+            CODE_DIR,
+        ],
+        [ENRICHED_PICKLE],
+        [ANILIST_CACHE, ANILIST_JOURNAL, MAL_CACHE, MAL_JOURNAL],
+    ),
+    Stage(
+        "render rows",
+        render_rows,
+        [ENRICHED_PICKLE, MAL_CACHE, MAL_JOURNAL, CODE_DIR],
+        [ROWS_PICKLE],
+    ),
+    Stage(
+        "render index",
+        render_index,
+        [ROWS_PICKLE, CODE_DIR],
+        [_output("index.html"), INDEX_PAGES],
+    ),
+    Stage(
+        "render newest",
+        render_newest,
+        [ROWS_PICKLE, CODE_DIR],
+        [_output("newest.html"), NEWEST_PAGES],
+    ),
+    Stage(
+        "render tag pages",
+        render_tag_pages,
+        [ROWS_PICKLE, CODE_DIR],
+        TAG_PAGES,
+    ),
+    Stage(
+        "search index",
+        search_index,
+        [ENRICHED_PICKLE, MAL_CACHE, MAL_JOURNAL, CODE_DIR],
+        [SEARCH_DIR],
+    ),
+    # the only stage which writes the image index, the next two only read it
+    Stage(
+        "index images",
+        index_images,
+        [constants.PEOPLE_SOURCES, constants.PEOPLE_IMAGES, CODE_DIR],
+        [constants.IMAGE_INDEX],
+    ),
+    Stage(
+        "render people",
+        render_people,
+        [constants.PEOPLE_SOURCES, constants.IMAGE_INDEX, CODE_DIR],
+        [_output("people.html")],
+    ),
+    Stage(
+        "resize images",
+        resize_images,
+        [
+            constants.PEOPLE_SOURCES,
+            constants.PEOPLE_IMAGES,
+            constants.IMAGE_INDEX,
+            CODE_DIR,
+        ],
+        [VARIANTS_DIR],
+    ),
+    Stage(
+        "copy assets",
+        copy_assets,
+        [str(STATIC_DIR / "css"), str(STATIC_DIR / "images"), str(STATIC_DIR / "js")],
+        [_output("css"), _output("images"), _output("js")],
+    ),
+    Stage(
+        "fingerprint and compress",
+        post_build,
+        [
+            _output("index.html"),
+            INDEX_PAGES,
+            _output("newest.html"),
+            NEWEST_PAGES,
+            _output("people.html"),
+            *TAG_PAGES,
+            SEARCH_DIR,
+            _output("css"),
+            _output("js"),
+            _output("images"),
+            VARIANTS_DIR,
+            CODE_DIR,
+        ],
+        [_output("assets")],
+        # rewrites the pages, and writes .gz/.br files next to everything
+        [
+            _output("index.html"),
+            INDEX_PAGES,
+            _output("newest.html"),
+            NEWEST_PAGES,
+            _output("people.html"),
+            *TAG_PAGES,
+            SEARCH_DIR,
+            _output("css"),
+            _output("js"),
+            _output("images"),
+            VARIANTS_DIR,
+        ],
+    ),
+]
+
+
+def _is_glob(path: str) -> bool:
+    return "*" in path
+
+
+def _files(path: str) -> List[Path]:
+    if _is_glob(path):
+        return sorted(Path(p) for p in glob.glob(path))
+    p = Path(path)
+    if p.is_dir():
+        return sorted(
+            f for f in p.rglob("*") if f.is_file() and "__pycache__" not in f.parts
+        )
+    return [p]
+
+
+def input_digest(path: str) -> str:
+    """Hash of the names and contents of the files at path"""
+    h = sha256()
+    for f in _files(path):
+        h.update(str(f).encode())
+        h.update(f.read_bytes() if f.exists() else b"missing")
+    return h.hexdigest()
+
+
+def digest(
+    stage: Stage, options: Options, inputs: Optional[Dict[str, str]] = None
+) -> str:
+    """
+    Hash of the build options and the contents of every input of a stage
+    inputs: digests of some of the inputs (see input_digest), to use
+        instead of reading them again
+    """
+    h = sha256(f"{stage.name}{options!r}".encode())
+    for inp in stage.inputs:
+        d = inputs[inp] if inputs and inp in inputs else input_digest(inp)
+        h.update(d.encode())
+    return h.hexdigest()
+
+
+def dependencies(stages: List[Stage]) -> Dict[str, Set[str]]:
+    """Each stage depends on the stages which write one of its inputs"""
+    writers = {out: s.name for s in stages for out in s.outputs}
+    return {
+        s.name: {writers[inp] for inp in s.inputs if inp in writers} for s in stages
+    }
+
+
+def _is_up_to_date(
+    stage: Stage, stamps: Dict[str, str], options: Options, inputs: Dict[str, str]
+) -> bool:
+    # a glob can match nothing, e.g. when the list isn't paginated
+    return stamps.get(stage.name) == digest(stage, options, inputs) and all(
+        os.path.exists(out) for out in stage.outputs if not _is_glob(out)
+    )
+
+
+def build(
+    stages: List[Stage], options: Options, force: bool = False, jobs: int = 0
+) -> None:
+    """Runs each stage once its dependencies are done, in parallel where possible"""
+    stamps: Dict[str, str] = {}
+    if not force and os.path.exists(STAMPS):
+        with open(STAMPS) as f:
+            stamps = json.load(f)
+    deps = dependencies(stages)
+    by_name = {s.name: s for s in stages}
+    pending = set(by_name)
+    finished: Set[str] = set()
+    running: Dict["Future[None]", Stage] = {}
+    started: Dict[str, float] = {}
+    # digests of each running stage's inputs, from before it started
+    before: Dict[str, Dict[str, str]] = {}
+
+    def save_stamps() -> None:
+        Path(STAMPS).parent.mkdir(parents=True, exist_ok=True)
+        with open(STAMPS, "w") as f:
+            json.dump(stamps, f, indent=4)
+
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        while pending or running:
+            for name in sorted(pending):
+                if not deps[name] <= finished:
+                    continue
+                pending.remove(name)
+                stage = by_name[name]
+                inputs = {inp: input_digest(inp) for inp in stage.inputs}
+                if _is_up_to_date(stage, stamps, options, inputs):
+                    print(f"[build] {name}: up to date")
+                    finished.add(name)
+                else:
+                    started[name] = time.perf_counter()
+                    before[name] = inputs
+                    running[pool.submit(stage.run, options)] = stage
+            if not running:
+                if pending and not any(deps[n] <= finished for n in pending):
+                    raise RuntimeError(f"Stages with unmet dependencies: {pending}")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage = running.pop(fut)
+                try:
+                    fut.result()
+                except Exception:
+                    stamps.pop(stage.name, None)
+                    save_stamps()
+                    raise
+                took = time.perf_counter() - started[stage.name]
+                print(f"[build] {stage.name}: done in {took:.2f}s")
+                # stamp the inputs as they were when the stage started, so
+                # one changed while it ran is picked up by the next build.
+                # Except for the inputs the stage writes itself
+                inputs = before.pop(stage.name)
+                inputs.update({inp: input_digest(inp) for inp in stage.updates})
+                stamps[stage.name] = digest(stage, options, inputs)
+                finished.add(stage.name)
+            save_stamps()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="build the site into ./output")
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="run every stage, even if unchanged"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=0, help="worker processes (default: cores)"
+    )
+    parser.add_argument(
+        "--renderer",
+        choices=["yattag", "compiled"],
+        default=Options().renderer,
+        help="how rows/cards are rendered (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-pretty",
+        dest="pretty",
+        action="store_false",
+        help="don't indent the generated html",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="validate every source, not just the ones which changed",
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="production build; no indentation, comments or extra whitespace",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=Options().page_size,
+        metavar="N",
+        help="split the list into pages of N shorts (default: one page)",
+    )
+    args = parser.parse_args()
+    start = time.perf_counter()
+    options = Options(
+        renderer=args.renderer,
+        pretty=args.pretty or args.minify,
+        strict=args.strict,
+        minify=args.minify,
+        page_size=args.page_size,
+    )
+    build(STAGES, options, force=args.force, jobs=args.jobs)
+    print(f"[build] finished in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
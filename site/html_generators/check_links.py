@@ -0,0 +1,335 @@
+import os
+import re
+import sys
+import json
+import time
+import html
+import asyncio
+import argparse
+from pathlib import Path
+from urllib.parse import quote, urlparse
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import aiohttp
+
+from . import constants, mal_ids, ratelimit
+from .generate_list import Source, join_urls, load_sources
+from .journal import JournalStore
+from .freshness import DAY
+
+# checks the external links on the generated site, to make sure none of
+# them have been deleted. The MAL ids in the sources are checked against
+# the list of all MAL ids (see mal_ids.py), YouTube/Vimeo links with their
+# oEmbed endpoints (which 404 for deleted videos, and 401/403 for private
+# videos or ones which can't be embedded), and everything else with a HEAD
+# request, falling back to GET for servers which don't support HEAD.
+# Broken links are written to broken.log
+#
+# The last result for each link is saved, so a run only checks links which
+# are new, were broken last time, or haven't been checked in --max-age days
+
+ROOT_DIR = Path(constants.this_dir).parent.parent
+BROKEN_LOG = ROOT_DIR / "broken.log"
+RESULTS = os.path.join(constants.CACHE_DIR, "link_checks.json")
+
+
+OEMBED = {
+    "youtu": "https://www.youtube.com/oembed?format=json&url={}",
+    "vimeo": "https://vimeo.com/api/oembed.json?url={}",
+}
+
+HREF = re.compile(r'href="([^"]*)"')
+MAL_ANIME = re.compile(r"myanimelist\.net/anime/(\d+)")
+
+USER_AGENT = (
+    "animeshorts link checker (+https://github.com/seanbreckenridge/animeshorts)"
+)
+
+
+class Result(NamedTuple):
+    url: str
+    # 'mal', 'video' or 'http'
+    kind: str
+    ok: bool
+    status: Optional[int] = None
+    # where the url redirected to, if it did
+    final_url: Optional[str] = None
+    redirects: Tuple[str, ...] = ()
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    def log_line(self) -> str:
+        if self.kind == "mal":
+            return f"{self.url} not in MAL ID CACHE"
+        if self.kind == "video" and self.status in (401, 403):
+            return f"{self.url} not valid (private, or embedding disabled)"
+        return f"{self.url} not valid"
+
+
+class ResultStore:
+    """The last result for each (video/http) link, and how many times in a row it failed
+    args:
+        path: file the results are kept in
+        max_age: seconds before a working link is checked again
+    """
+
+    def __init__(self, path: str = RESULTS, max_age: float = 7 * DAY):
+        self.store = JournalStore(path, sort_keys=True, compact_after=256)
+        self.max_age = max_age
+
+    def is_due(self, url: str) -> bool:
+        entry = self.store.get(url)
+        if entry is None or not entry["ok"]:
+            return True
+        return bool(time.time() - entry["checked"] > self.max_age)
+
+    def due(self, urls: Iterable[str], budget: Optional[int] = None) -> List[str]:
+        """
+        The links which should be checked; new ones, then broken ones, then
+        the ones checked longest ago. If budget is given, at most that many
+        """
+
+        def priority(url: str) -> Tuple[int, float]:
+            entry = self.store.get(url)
+            if entry is None:
+                return (0, 0.0)
+            return (1 if not entry["ok"] else 2, float(entry["checked"]))
+
+        due = sorted((u for u in urls if self.is_due(u)), key=priority)
+        return due[:budget] if budget is not None else due
+
+    def record(self, result: Result) -> None:
+        previous = self.store.get(result.url) or {}
+        streak = 0 if result.ok else previous.get("streak", 0) + 1
+        entry = result._asdict()
+        entry.update(checked=time.time(), streak=streak)
+        self.store[result.url] = entry
+
+    def result(self, url: str) -> Optional[Result]:
+        entry = self.store.get(url)
+        if entry is None:
+            return None
+        fields = {k: entry[k] for k in Result._fields}
+        fields["redirects"] = tuple(fields["redirects"])
+        return Result(**fields)
+
+    def details(self, url: str) -> Dict[str, Any]:
+        """When url was last checked, and how many times in a row it failed"""
+        entry = self.store.get(url) or {}
+        return {k: entry[k] for k in ("checked", "streak") if k in entry}
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def extract_urls(output_dir: str = constants.OUTPUT_DIR) -> List[str]:
+    """Every external (https) link on the generated pages"""
+    urls: Set[str] = set()
+    for page in Path(output_dir).glob("*.html"):
+        for href in HREF.findall(page.read_text()):
+            href = html.unescape(href)
+            if href.startswith("https"):
+                urls.add(href)
+    return sorted(urls)
+
+
+def classify(url: str) -> Optional[str]:
+    """How url should be checked, None if it shouldn't be"""
+    # MAL links are checked from the sources, see check_mal
+    if "anilist.co" in url or MAL_ANIME.search(url):
+        return None
+    if "youtu" in url or "vimeo" in url:
+        return "video"
+    return "http"
+
+
+class HostLimits:
+    """Limits how many requests are made to each host at once, and how often"""
+
+    def __init__(self, per_host: int):
+        self.per_host = per_host
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[ratelimit.TokenBucket]:
+        host = urlparse(url).hostname or url
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host)
+        async with self.semaphores[host]:
+            limiter = ratelimit.bucket(url)
+            await limiter.acquire_async()
+            yield limiter
+
+
+async def request(
+    session: aiohttp.ClientSession, limits: HostLimits, method: str, url: str
+) -> aiohttp.ClientResponse:
+    async with limits.slot(url) as limiter:
+        async with session.request(method, url, allow_redirects=True) as resp:
+            limiter.observe(resp.status, resp.headers)
+            # only need the status, the body isn't read
+            return resp
+
+
+async def check_http(
+    session: aiohttp.ClientSession, limits: HostLimits, url: str
+) -> Result:
+    start = time.perf_counter()
+    try:
+        resp = await request(session, limits, "HEAD", url)
+        if resp.status >= 400:
+            # lots of servers don't support HEAD, or treat it differently
+            resp = await request(session, limits, "GET", url)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return Result(
+            url,
+            "http",
+            False,
+            error=repr(e),
+            elapsed=time.perf_counter() - start,
+        )
+    final_url = str(resp.url)
+    return Result(
+        url,
+        "http",
+        resp.status < 400,
+        resp.status,
+        final_url if final_url != url else None,
+        tuple(str(r.url) for r in resp.history),
+        elapsed=time.perf_counter() - start,
+    )
+
+
+async def check_video(
+    session: aiohttp.ClientSession, limits: HostLimits, url: str
+) -> Result:
+    start = time.perf_counter()
+    endpoint = next(e for k, e in OEMBED.items() if k in url)
+    try:
+        resp = await request(session, limits, "GET", endpoint.format(quote(url)))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return Result(
+            url, "video", False, error=repr(e), elapsed=time.perf_counter() - start
+        )
+    # 401/403 are what oEmbed returns for videos which were made private
+    # or had embedding disabled, which can't be watched from the site
+    return Result(
+        url,
+        "video",
+        resp.status < 400,
+        resp.status,
+        elapsed=time.perf_counter() - start,
+    )
+
+
+async def check_all(
+    urls: List[str], per_host: int = 2, timeout: float = 30
+) -> List[Result]:
+    """Checks each video/http link in urls"""
+    limits = HostLimits(per_host)
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={"User-Agent": USER_AGENT},
+        connector=aiohttp.TCPConnector(limit=50),
+    ) as session:
+
+        async def check(url: str, kind: str) -> Result:
+            if kind == "video":
+                result = await check_video(session, limits, url)
+            else:
+                result = await check_http(session, limits, url)
+            status = result.status or result.error
+            print(f"checked {url} ({status})", file=sys.stderr)
+            return result
+
+        results = await asyncio.gather(
+            *(check(url, kind) for url in urls if (kind := classify(url)) is not None)
+        )
+    return sorted(results, key=lambda r: r.url)
+
+
+def check_mal(sources: List[Source]) -> List[Result]:
+    """Checks the MAL ids in the sources (rather than the links) against mal-id-cache"""
+    ids = mal_ids.load_ids()
+    return [
+        Result(
+            join_urls("https://myanimelist.net", "anime", str(mal_id)),
+            "mal",
+            mal_id in ids,
+        )
+        for mal_id in mal_ids.referenced_ids(sources)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="check the external links on the generated site",
+        epilog="stderr is logs, stdout is broken links",
+    )
+    parser.add_argument("--output-dir", default=constants.OUTPUT_DIR)
+    parser.add_argument(
+        "--per-host", type=int, default=2, help="concurrent requests to each host"
+    )
+    parser.add_argument("--timeout", type=float, default=30, help="seconds per request")
+    parser.add_argument("--json", metavar="FILE", help="write every result to FILE")
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=7,
+        help="days before a working link is checked again (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--budget", type=int, help="check at most N links, the stalest first"
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="check every link, ignoring past results"
+    )
+    args = parser.parse_args()
+    start = time.perf_counter()
+    store = ResultStore(max_age=args.max_age * DAY)
+    urls = extract_urls(args.output_dir)
+    saved = [url for url in urls if classify(url) is not None]
+    due = saved if args.all else store.due(saved, args.budget)
+    checked = asyncio.run(check_all(due, args.per_host, args.timeout))
+    for r in checked:
+        store.record(r)
+    store.close()
+    checked.extend(check_mal(load_sources()))
+    fresh = {r.url for r in checked}
+    results = sorted(
+        checked
+        + [r for r in map(store.result, saved) if r is not None and r.url not in fresh],
+        key=lambda r: r.url,
+    )
+    broken = [r for r in results if not r.ok]
+    with BROKEN_LOG.open("w") as f:
+        for r in broken:
+            f.write(r.log_line() + "\n")
+            print(r.log_line())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                [{**r._asdict(), **store.details(r.url)} for r in results],
+                f,
+                indent=4,
+            )
+    print(
+        f"checked {len(checked)} links in {time.perf_counter() - start:.1f}s "
+        f"({len(results) - len(checked)} checked recently), {len(broken)} broken",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
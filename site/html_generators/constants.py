@@ -14,6 +14,17 @@ LIST_SOURCES = os.path.join(SOURCES_DIR, "list_sources.yaml")
 PEOPLE_SOURCES = os.path.join(SOURCES_DIR, "people_sources.yaml")
 assert os.path.exists(LIST_SOURCES)
 assert os.path.exists(PEOPLE_SOURCES)
+# dimensions/hashes of the people images, see image_index.py
+IMAGE_INDEX = os.path.join(SOURCES_DIR, "image_index.json")
+PEOPLE_IMAGES = os.path.abspath(os.path.join(this_dir, "../static/images/people"))
+# build caches, not checked into git
+CACHE_DIR = os.path.abspath(os.path.join(this_dir, "../.cache"))
+FRAGMENT_CACHE = os.path.join(CACHE_DIR, "fragments.json")
+MAL_NAME_CACHE = os.path.abspath(os.path.join(this_dir, "../mal_name_cache.json"))
+ANILIST_CACHE = os.path.abspath(os.path.join(this_dir, "../anilist_cache.json"))
+# APIs, can be pointed at a local server instead (see mock_api.py)
+JIKAN_URL = os.environ.get("ANIMESHORTS_JIKAN_URL", "https://api.jikan.moe/v3")
+ANILIST_URL = os.environ.get("ANIMESHORTS_ANILIST_URL", "https://graphql.anilist.co")
 LIST_CSS = "list.css"
 PEOPLE_CSS = "people.css"
 
@@ -0,0 +1,67 @@
+import json
+from pathlib import Path
+from hashlib import sha256
+from typing import Dict, Optional, Set
+
+from . import constants
+
+
+class FragmentCache:
+    """Persistent cache of rendered HTML fragments
+
+    Fragments are keyed by a hash of everything they were rendered from,
+    so an edited source just misses the cache and gets rendered again.
+    args:
+        jsonpath: file the cache is persisted to
+        max_stale: number of fragments not used in this build to keep around
+    """
+
+    def __init__(self, jsonpath: str = constants.FRAGMENT_CACHE, max_stale: int = 500):
+        self.jsonpath = Path(jsonpath)
+        self.max_stale = max_stale
+        # ordered from least to most recently used
+        self.items: Dict[str, str] = {}
+        self.used: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        if self.jsonpath.exists():
+            try:
+                self.items = json.loads(self.jsonpath.read_text())
+            except json.JSONDecodeError:  # file is broken, start over
+                self.changed = True
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return sha256("\0".join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        fragment = self.items.pop(key, None)
+        if fragment is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items[key] = fragment  # move to the end
+        self.used.add(key)
+        return fragment
+
+    def set(self, key: str, fragment: str) -> None:
+        self.items.pop(key, None)
+        self.items[key] = fragment
+        self.used.add(key)
+        self.changed = True
+
+    def evict(self) -> None:
+        """Drop the least recently used fragments which weren't used in this build"""
+        stale = [k for k in self.items if k not in self.used]
+        for k in stale[: max(len(stale) - self.max_stale, 0)]:
+            del self.items[k]
+            self.changed = True
+
+    def write(self) -> None:
+        self.evict()
+        if not self.changed:
+            return
+        self.jsonpath.parent.mkdir(parents=True, exist_ok=True)
+        self.jsonpath.write_text(json.dumps(self.items))
+        self.changed = False
@@ -0,0 +1,85 @@
+import os
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from . import constants
+from .journal import JournalStore
+
+DAY = 24 * 60 * 60
+
+
+def meta_path(jsonpath: str) -> str:
+    """Where the metadata for the cache at jsonpath is kept"""
+    name = os.path.splitext(os.path.basename(jsonpath))[0]
+    return os.path.join(constants.CACHE_DIR, f"{name}.meta.json")
+
+
+class Freshness:
+    """Tracks when each entry in a name cache was fetched, to decide which to refresh
+
+    Also keeps the ETag/Last-Modified headers each entry was fetched with,
+    so refreshing an unchanged entry is a conditional request
+    args:
+        path: file the metadata is stored in
+        ttl: seconds before an entry should be refreshed
+        negative_ttl: seconds before an entry which wasn't found (None) should be refreshed
+        budget: most entries to refresh per build
+    """
+
+    def __init__(self, path: str, ttl: float, negative_ttl: float, budget: int):
+        self.store = JournalStore(path, compact_after=256)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.budget = budget
+        self.refreshed = 0
+
+    def adopt(self, keys: Iterable[str]) -> None:
+        """Entries cached before their fetch time was tracked count as fetched now"""
+        now = time.time()
+        for key in keys:
+            if key not in self.store:
+                self.store[key] = {"fetched": now}
+        self.store.sync()
+
+    def stamp(self, key: str, headers: Optional[Mapping[str, str]] = None) -> None:
+        """Marks key as fetched just now. headers are the response headers, if any"""
+        meta: Dict[str, Any] = {"fetched": time.time()}
+        if headers is None:
+            # not modified, keep the validators it was fetched with
+            previous = self.store.get(key) or {}
+            meta.update((k, v) for k, v in previous.items() if k != "fetched")
+        else:
+            for header, name in (("ETag", "etag"), ("Last-Modified", "modified")):
+                if headers.get(header):
+                    meta[name] = headers[header]
+        self.store[key] = meta
+
+    def is_stale(self, key: str, value: Any) -> bool:
+        meta = self.store.get(key)
+        if meta is None:
+            return False
+        ttl = self.ttl if value is not None else self.negative_ttl
+        return bool(time.time() - meta["fetched"] > ttl)
+
+    def take(self, keys: Iterable[str], data: Mapping[str, Any]) -> List[str]:
+        """The stale keys to refresh now, oldest first, within the remaining budget"""
+        stale = sorted(
+            {k for k in keys if k in data and self.is_stale(k, data[k])},
+            key=lambda k: float(self.store[k]["fetched"]),
+        )
+        stale = stale[: max(0, self.budget - self.refreshed)]
+        self.refreshed += len(stale)
+        return stale
+
+    def validators(self, key: str) -> Dict[str, str]:
+        """Headers to make a conditional request for key"""
+        meta = self.store.get(key) or {}
+        headers = {}
+        if "etag" in meta:
+            headers["If-None-Match"] = meta["etag"]
+        if "modified" in meta:
+            headers["If-Modified-Since"] = meta["modified"]
+        return headers
+
+    def sync(self) -> None:
+        self.store.sync()
@@ -1,25 +1,48 @@
+import io
 import re
 import datetime
 import argparse
-from itertools import chain
+from pathlib import Path
+from functools import lru_cache
+from itertools import chain, count
 from hashlib import sha256
 from enum import Enum
 from urllib.parse import urljoin
-from typing import Dict, Sequence, Tuple, Union, List, Optional
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+    TypeVar,
+    Union,
+    List,
+    Optional,
+)
 
-import yaml
 from pydantic import BaseModel
-from yattag import Doc, indent  # type: ignore[import]
+import yattag  # type: ignore[import]
+from yattag import Doc  # type: ignore[import]
 from requests import Request
 
 from .anilist_names import AniListNames
 
 from . import constants
 from . import generate_navbar
-from .mal_name import Cache
+from . import html_writer
+from .mal_name import Cache, Names
+from .fragment_cache import FragmentCache
+from .sources import load_models
 
 
 IdType = Union[int, str]
+# key of the position of the MAL list in Source.database, on the list of
+# AniList URLs fetch_anilist_sources resolved from it
+MAL_INDEX = "mal_index"
 
 
 class Tag(Enum):
@@ -43,6 +66,16 @@ class Source(BaseModel):
     tags: List[Tag]
 
 
+def tag_slug(t: Tag) -> str:
+    return t.value.lower().strip().replace(" ", "-")
+
+
+def tag_page(t: Tag, list_order: constants.Order) -> str:
+    """The page listing only the shorts tagged t, without the .html"""
+    suffix = "-newest" if list_order == constants.Order.DATE else ""
+    return f"tag-{tag_slug(t)}{suffix}"
+
+
 def format_duration(dur: float) -> str:
     """Formats duration (from minutes) into a readable format"""
     if float(dur) >= 1.0:
@@ -73,34 +106,861 @@ def create_youtube(id: str) -> str:
     return str(Request("GET", base_url, params={"v": str(id)}).prepare().url)
 
 
+# characters create_id removes
+ID_CHARS = re.compile(r"[^\w]")
+
+
 def create_id(name: str, octothorpe: bool) -> str:
-    name = re.sub(r"[^\w]", "", name)  # remove problematic characters
+    name = ID_CHARS.sub("", name)  # remove problematic characters
     return "{}{}{}".format(
         "#" if octothorpe else "", str(name), sha256(name.encode()).hexdigest()[:10]
     )
 
 
-def sort_list(sources: List[Source], list_order: constants.Order) -> List[Source]:
+def list_id_name(key: str, ids: Sequence[IdType]) -> str:
+    """The name the id of a list of MAL/AniList entries or videos is made from"""
+    return "{}{}".format(key, "".join(map(str, ids)))
+
+
+def element_names(s: Source, key: str) -> List[str]:
+    """The names of every element create_row gives an id, for one short"""
+    names = [f"{key}-row"]
+    if s.extra_info is not None:
+        names.append(f"{key}-extra-info")
+    for links in chain(s.database or [], s.streaming or []):
+        for ids in links.values():
+            if isinstance(ids, list):
+                names.append(list_id_name(key, ids))
+    return names
+
+
+class IdRegistry:
+    """Element ids, each computed once per build
+
+    Every button and the element it toggles get their ids from here. Ids
+    are made from the name of the short; shorts which share a name (after
+    create_id removes punctuation) get the date they were added, and if
+    need be a number, appended, see key. Any other collision raises a
+    ValueError
+    args:
+        sources: register the ids of each of these up front, so the keys
+            don't depend on rendering order, and collisions across the
+            whole list are caught before anything is rendered
+    """
+
+    def __init__(self, sources: Iterable[Source] = ()):
+        # name -> id
+        self.ids: Dict[str, str] = {}
+        # id -> (name, key of the short it belongs to)
+        self.owners: Dict[str, Tuple[str, Optional[str]]] = {}
+        # id(source) -> key
+        self.keys: Dict[int, str] = {}
+        # keys in use, as create_id sees them
+        self.taken: Set[str] = set()
+        for s in sources:
+            key = self.key(s)
+            for name in element_names(s, key):
+                self.register(name, key)
+
+    def key(self, s: Source) -> str:
+        """The name the ids of s are made from; unique among the registered shorts"""
+        key = self.keys.get(id(s))
+        if key is None:
+            candidates = chain(
+                [str(s.name), f"{s.name}-{s.date}"],
+                (f"{s.name}-{s.date}-{i}" for i in count(2)),
+            )
+            key = next(k for k in candidates if ID_CHARS.sub("", k) not in self.taken)
+            self.taken.add(ID_CHARS.sub("", key))
+            self.keys[id(s)] = key
+        return key
+
+    def register(self, name: str, key: Optional[str] = None) -> str:
+        element_id = create_id(name=name, octothorpe=False)
+        previous = self.owners.get(element_id)
+        if previous is not None:
+            prev_name, prev_key = previous
+            if prev_name != name or (
+                key is not None and prev_key is not None and prev_key != key
+            ):
+                raise ValueError(
+                    f"Duplicate element id {element_id}: {name!r} (in {key!r}) "
+                    f"and {prev_name!r} (in {prev_key!r})"
+                )
+        self.ids[name] = element_id
+        self.owners[element_id] = (name, key)
+        return element_id
+
+    def get(self, name: str, octothorpe: bool) -> str:
+        """Same as create_id, but only hashes each name once"""
+        element_id = self.ids.get(name)
+        if element_id is None:
+            element_id = self.register(name)
+        return f"#{element_id}" if octothorpe else element_id
+
+    def list_id(self, s: Source, entries: Sequence[IdType], octothorpe: bool) -> str:
+        return self.get(list_id_name(self.key(s), entries), octothorpe=octothorpe)
+
+    def extra_info_id(self, s: Source, octothorpe: bool) -> str:
+        return self.get(f"{self.key(s)}-extra-info", octothorpe=octothorpe)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def row_id(s: Source, ids: Optional[IdRegistry] = None) -> str:
+    """The id of the row for s, which the search results link to"""
+    ids = ids if ids is not None else IdRegistry()
+    return ids.get(f"{ids.key(s)}-row", octothorpe=False)
+
+
+# a source and its rendered row
+RenderedRow = Tuple[Source, str]
+
+
+def sort_rows(
+    rows: List[RenderedRow], list_order: constants.Order
+) -> List[RenderedRow]:
     if list_order == constants.Order.REC:
-        return sources
+        return rows
     else:
-        sources.sort(key=lambda s: s.date, reverse=True)
-        return sources
+        return sorted(rows, key=lambda r: r[0].date, reverse=True)
 
 
-def create_page(
+T = TypeVar("T")
+
+
+def chunk_list(lst: List[T], chunk_size: int) -> Iterator[List[T]]:
+    """Return chunk_size'd lists from the large list."""
+    for i in range(0, len(lst), chunk_size):
+        yield lst[i : i + chunk_size]
+
+
+class Page(NamedTuple):
+    """One page of a paginated list"""
+
+    # filename, without the .html
+    name: str
+    rows: List[RenderedRow]
+    # the pages before/after this one, if there are any
+    prev: Optional[str]
+    next: Optional[str]
+
+
+def page_href(name: str) -> str:
+    return "./" if name == "index" else f"./{name}"
+
+
+def paginate(
+    rows: List[RenderedRow], list_order: constants.Order, page_size: int
+) -> List[Page]:
+    """
+    Splits the ordered rows into pages of page_size. The first page is
+    index/newest, the rest are index-2, index-3... for the recommendation order
+
+    The date order is chunked starting from the oldest short, and its pages
+    are numbered from the oldest page (newest-1), so adding a short only
+    changes the first page (unless it was full)
+    """
+    ordered = sort_rows(rows, list_order)
+    if list_order == constants.Order.REC:
+        chunks = list(chunk_list(ordered, page_size)) or [[]]
+        names = ["index"] + [f"index-{i}" for i in range(2, len(chunks) + 1)]
+    else:
+        oldest_first = list(chunk_list(ordered[::-1], page_size)) or [[]]
+        chunks = [chunk[::-1] for chunk in reversed(oldest_first)]
+        names = ["newest"] + [f"newest-{n}" for n in range(len(chunks) - 1, 0, -1)]
+    return [
+        Page(
+            name,
+            chunk,
+            names[i - 1] if i > 0 else None,
+            names[i + 1] if i + 1 < len(names) else None,
+        )
+        for i, (name, chunk) in enumerate(zip(names, chunks))
+    ]
+
+
+# changes whenever this module, the compiled renderers or html_writer
+# (which indents the cached rows), or yattag (and so the row markup)
+# change, which invalidates every cached row
+RENDERER_VERSION = sha256(
+    b"".join(
+        Path(__file__).with_name(module).read_bytes()
+        for module in ("generate_list.py", "templates.py", "html_writer.py")
+    )
+    + yattag.__version__.encode()
+).hexdigest()
+
+
+def row_mal_ids(s: Source, download_names: bool) -> List[int]:
+    """The MAL ids whose names create_row will render for this source"""
+    if s.database is None:
+        return []
+    has_youtube_list = s.streaming is not None and any(
+        "youtube" in vid and isinstance(vid["youtube"], list) for vid in s.streaming
+    )
+    if not download_names and not has_youtube_list:
+        return []
+    return [
+        int(mal_id)
+        for db in s.database
+        if "mal" in db and isinstance(db["mal"], list)
+        for mal_id in db["mal"]
+    ]
+
+
+def anilist_mal_ids(
+    s: Source, db: Dict[str, Union[List[IdType], IdType]]
+) -> List[IdType]:
+    """The list of MAL ids the list of AniList URLs in db was resolved from"""
+    assert s.database is not None
+    index = db.get(MAL_INDEX)
+    mal = s.database[index].get("mal") if isinstance(index, int) else None
+    if not isinstance(mal, list):
+        raise ValueError(f"No MAL list matches the AniList list for {s.name}")
+    return mal
+
+
+def row_names(s: Source, mal_names: Names, download_names: bool) -> List[str]:
+    """The MAL names create_row will render for this source"""
+    return [mal_names.get(mal_id) for mal_id in row_mal_ids(s, download_names)]
+
+
+def row_cache_key(
+    s: Source, mal_names: Names, download_names: bool, level: Optional[int], key: str
+) -> str:
+    """Hash of everything create_row depends on; key is the IdRegistry key of s"""
+    return FragmentCache.key(
+        RENDERER_VERSION,
+        str(download_names),
+        str(level),
+        key,
+        s.json(),
+        *row_names(s, mal_names, download_names),
+    )
+
+
+# rows are inside html > body > main
+ROW_LEVEL = 3
+
+# placeholder in a rendered row, replaced by place_date_badge
+DATE_BADGE = "<!-- date -->"
+
+
+def create_row(
+    s: Source,
+    mal_names: Names,
+    download_names: bool,
+    ids: Optional[IdRegistry] = None,
+) -> str:
+    """
+    Creates the (unindented) markup for a single row in the list
+
+    The same markup is used for every ordering, the date badge
+    is only filled in by place_date_badge for the Date Added page
+    ids: where the element ids come from, see render_rows
+    """
+    if ids is None:
+        ids = IdRegistry()
+    doc, tag, text = Doc().tagtext()
+    with tag("div", ("class", "anime-row-container"), ("id", row_id(s, ids))):
+        with tag(
+            "div", klass="row anime-row align-items-center border"
+        ):  # row for each anime
+            # name/tags/info button
+            with tag("div", klass="col-sm"):
+                # name
+                with tag("h6"):
+                    text(str(s.name))
+                    # tags
+                    for t in sorted(s.tags, key=lambda t: t.value):
+                        with tag("span", klass=f"badge tag {tag_slug(t)}"):
+                            with tag(
+                                "a",
+                                ("href", f"./{tag_page(t, constants.Order.REC)}"),
+                                ("class", "badge-link"),
+                                ("data-toggle", "tooltip"),
+                                (
+                                    "data-original-title",
+                                    f"list only shorts tagged '{t.value.lower()}'",
+                                ),
+                            ):
+                                text(t.value)
+                    doc.asis(DATE_BADGE)
+                    # if this has extra info
+                    if s.extra_info is not None:
+                        with tag(
+                            "a",
+                            ("role", "button"),
+                            ("class", "more-info-expand ml-2"),
+                            (
+                                "href",
+                                ids.extra_info_id(s, octothorpe=True),
+                            ),
+                            ("aria-expanded", "false"),
+                            ("data-toggle", "collapse"),
+                        ):
+                            text("ⓘ")
+
+            # time (durations/episodes)
+            if s.duration is not None and s.episodes is not None:
+                dur, eps = s.duration, s.episodes
+                with tag("div", ("class", "time col-md-1")):
+                    if eps == 1:
+                        with tag("span", klass="badge"):
+                            text(str(format_duration(dur)))
+                    elif eps == 0:  # unknown ep count
+                        with tag("span", klass="badge"):
+                            text(f"{format_duration(dur)} x ? eps")
+                    else:
+                        with tag("span", klass="badge"):
+                            # display as multiple episodes
+                            text(f"{format_duration(dur)} x {eps} eps")
+            else:
+                print("Undefined duration/episodes:", s)
+
+            # buttons
+            with tag(
+                "div",
+                klass="circular-buttons-container col-md-4 col-lg-3 col-xl-3",
+            ):
+                # databases
+                if s.database is not None:
+                    for db in s.database:
+                        # MAL
+                        if "mal" in db:
+                            # if multiple entries
+                            if isinstance(db["mal"], list):
+                                # place button
+                                list_hash_id = ids.list_id(
+                                    s, db["mal"], octothorpe=True
+                                )
+                                with tag(
+                                    "a",
+                                    ("role", "button"),
+                                    ("href", list_hash_id),
+                                    ("aria-expanded", "false"),
+                                    ("data-toggle", "collapse"),
+                                ):
+                                    doc.stag(
+                                        "img",
+                                        (
+                                            "src",
+                                            "./images/mal_icon.png",
+                                        ),
+                                        (
+                                            "alt",
+                                            f"{s.name} (MyAnimeList)",
+                                        ),
+                                        ("class", "rounded-circle"),
+                                    )
+
+                            else:
+                                # if single entry
+                                mal_url = join_urls(
+                                    "https://myanimelist.net",
+                                    "anime",
+                                    str(db["mal"]),
+                                )
+                                with tag(
+                                    "a",
+                                    ("href", mal_url),
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                ):
+                                    doc.stag(
+                                        "img",
+                                        (
+                                            "src",
+                                            """./images/mal_icon.png""",
+                                        ),
+                                        (
+                                            "alt",
+                                            f"{s.name} (MyAnimeList)",
+                                        ),
+                                        ("class", "rounded-circle"),
+                                    )
+                        # add elifs for other databases here
+                        # (if expanding later)
+                        elif "anilist" in db:
+                            anilist_link = db["anilist"]
+                            anilist_icon = (
+                                ("src", """./images/anilist.png"""),
+                                ("alt", f"{s.name} (AniList)"),
+                                ("class", "rounded-circle anilist-circle"),
+                            )
+                            # if resolved from multiple MAL entries
+                            if isinstance(anilist_link, list):
+                                list_hash_id = ids.list_id(
+                                    s, anilist_link, octothorpe=True
+                                )
+                                with tag(
+                                    "a",
+                                    ("role", "button"),
+                                    ("href", list_hash_id),
+                                    ("aria-expanded", "false"),
+                                    ("data-toggle", "collapse"),
+                                ):
+                                    doc.stag("img", *anilist_icon)
+                            else:
+                                with tag(
+                                    "a",
+                                    ("href", anilist_link),
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                ):
+                                    doc.stag("img", *anilist_icon)
+
+                        else:
+                            print("Warning, found unknown database:", db)
+
+                # streaming
+                if s.streaming is not None:
+                    for vid in s.streaming:
+                        if "youtube" in vid:
+                            # if list of videos
+                            if isinstance(vid["youtube"], list):
+                                # print("Creating list for", s['name'])
+                                list_hash_id = ids.list_id(
+                                    s, vid["youtube"], octothorpe=True
+                                )
+                                with tag(
+                                    "a",
+                                    ("role", "button"),
+                                    ("href", list_hash_id),
+                                    ("aria-expanded", "false"),
+                                    ("data-toggle", "collapse"),
+                                ):
+                                    doc.stag(
+                                        "img",
+                                        (
+                                            "src",
+                                            "./images/yt_icon.png",
+                                        ),
+                                        ("alt", f"{s.name} (Youtube)"),
+                                        ("class", "rounded-circle"),
+                                    )
+                                    if s.cc:
+                                        with tag(
+                                            "span",
+                                            ("class", "badge cc"),
+                                            ("data-toggle", "tooltip"),
+                                            (
+                                                "data-original-title",
+                                                "Videos have Subtitles",
+                                            ),
+                                        ):
+                                            text("CC")
+                            else:
+                                # single video
+                                with tag(
+                                    "a",
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                    href=join_urls(
+                                        "https://youtu.be"
+                                        if "playlist" not in str(vid["youtube"])
+                                        else "https://youtube.com",
+                                        str(vid["youtube"]),
+                                    ),
+                                ):
+                                    doc.stag(
+                                        "img",
+                                        (
+                                            "src",
+                                            "./images/yt_icon.png",
+                                        ),
+                                        ("alt", f"{s.name} (Youtube)"),
+                                        ("class", "rounded-circle"),
+                                    )
+                                    if s.cc:
+                                        with tag(
+                                            "span",
+                                            ("class", "badge cc"),
+                                            ("data-toggle", "tooltip"),
+                                            (
+                                                "data-original-title",
+                                                "Video has Subtitles",
+                                            ),
+                                        ):
+                                            text("CC")
+
+                        elif "vimeo" in vid:
+                            # if list of videos
+                            if isinstance(vid["vimeo"], list):
+                                list_hash_id = ids.list_id(
+                                    s, vid["vimeo"], octothorpe=True
+                                )
+                                with tag(
+                                    "a",
+                                    ("role", "button"),
+                                    ("href", list_hash_id),
+                                    ("aria-expanded", "false"),
+                                    ("data-toggle", "collapse"),
+                                ):
+                                    doc.stag(
+                                        "img",
+                                        (
+                                            "src",
+                                            "./images/vimeo_icon.png",
+                                        ),
+                                        (
+                                            "alt",
+                                            f"{s.name} (Vimeo)",
+                                        ),
+                                        ("class", "rounded-circle"),
+                                    )
+                            else:
+                                # single video
+                                with tag(
+                                    "a",
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                    href=join_urls(
+                                        "https://vimeo.com",
+                                        str(vid["vimeo"]),
+                                    ),
+                                ):
+                                    doc.stag(
+                                        "img",
+                                        (
+                                            "src",
+                                            "./images/vimeo_icon.png",
+                                        ),
+                                        ("alt", f"{s.name} (Vimeo)"),
+                                        ("class", "rounded-circle"),
+                                    )
+                        elif "crunchyroll" in vid:
+                            with tag(
+                                "a",
+                                ("target", "_blank"),
+                                ("rel", "norefferer"),
+                                href=join_urls(
+                                    "http://www.crunchyroll.com",
+                                    str(vid["crunchyroll"]),
+                                ),
+                            ):
+                                doc.stag(
+                                    "img",
+                                    (
+                                        "src",
+                                        "./images/cr_icon.png",
+                                    ),
+                                    ("alt", f"{s.name} (Crunchyroll)"),
+                                    ("class", "rounded-circle"),
+                                )
+                        elif "netflix" in vid:
+                            with tag(
+                                "a",
+                                ("target", "_blank"),
+                                ("rel", "norefferer"),
+                                href=join_urls(
+                                    "https://www.netflix.com",
+                                    "title",
+                                    str(vid["netflix"]),
+                                ),
+                            ):
+                                doc.stag(
+                                    "img",
+                                    (
+                                        "src",
+                                        "./images/netflix_icon.png",
+                                    ),
+                                    ("alt", f"{s.name} (Netflix)"),
+                                    ("class", "rounded-circle"),
+                                )
+                        elif "funimation" in vid:
+                            with tag(
+                                "a",
+                                href=join_urls(
+                                    "https://www.funimation.com",
+                                    "shows",
+                                    str(vid["funimation"]),
+                                ),
+                            ):
+                                doc.stag(
+                                    "img",
+                                    (
+                                        "src",
+                                        "./images/fn_icon.png",
+                                    ),
+                                    ("alt", f"{s.name} (Funimation)"),
+                                    ("class", "rounded-circle"),
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                )
+                        elif "hidive" in vid:
+                            with tag(
+                                "a",
+                                ("target", "_blank"),
+                                ("rel", "norefferer"),
+                                href=join_urls(
+                                    "https://www.hidive.com",
+                                    "tv",
+                                    str(vid["hidive"]),
+                                ),
+                            ):
+                                doc.stag(
+                                    "img",
+                                    (
+                                        "src",
+                                        "./images/hidive_icon.png",
+                                    ),
+                                    ("alt", f"{s.name} (Hidive)"),
+                                    ("class", "rounded-circle"),
+                                )
+
+                        elif "twitter" in vid:
+                            with tag(
+                                "a",
+                                ("target", "_blank"),
+                                ("rel", "norefferer"),
+                                href=join_urls(str(vid["twitter"])),
+                            ):
+                                doc.stag(
+                                    "img",
+                                    (
+                                        "src",
+                                        "./images/twitter.svg",
+                                    ),
+                                    ("alt", f"{s.name} (Twitter)"),
+                                    ("class", "rounded-circle"),
+                                )
+                        elif "website" in vid:
+                            assert isinstance(vid, dict)
+                            with tag(
+                                "a",
+                                ("target", "_blank"),
+                                ("rel", "norefferer"),
+                                href=vid["website"],
+                            ):
+                                doc.stag(
+                                    "img",
+                                    (
+                                        "src",
+                                        "./images/link.png",
+                                    ),
+                                    (
+                                        "alt",
+                                        "website",
+                                    ),
+                                    ("class", "rounded-circle"),
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                )
+                        else:
+                            print(
+                                "Warning, unfound 'source' in streaming:",
+                                vid,
+                            )
+
+        # HIDDEN ROWS
+        # insert hidden row for extra info if ⓘ exists
+        if s.extra_info is not None:
+            with tag(
+                "div",
+                klass="collapse border rounded-bottom border-top-0 mb-1",
+                id=ids.extra_info_id(s, octothorpe=False),
+            ):
+                with tag("p", klass="pl-2 mb-0"):
+                    text(str(s.extra_info))
+
+        # insert hidden row for databases
+        if s.database is not None:
+            for db in s.database:
+                if "mal" in db and isinstance(db["mal"], list):
+                    list_hash_id = ids.list_id(s, db["mal"], octothorpe=False)
+                    with tag(
+                        "div",
+                        klass="collapse rounded mb-2",
+                        id=list_hash_id,
+                    ):
+                        with tag("div", klass="list-group"):
+                            for entry in db["mal"]:
+                                with tag(
+                                    "a",
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                    klass="list-group-item list-group-item-action",
+                                    href=join_urls(
+                                        "https://myanimelist.net",
+                                        "anime",
+                                        str(entry),
+                                    ),
+                                ):
+                                    if download_names:
+                                        text(mal_names.get(int(entry)))
+                                    else:
+                                        text(entry)
+                elif "anilist" in db and isinstance(db["anilist"], list):
+                    list_hash_id = ids.list_id(s, db["anilist"], octothorpe=False)
+                    mal_ids = anilist_mal_ids(s, db)
+                    with tag(
+                        "div",
+                        klass="collapse rounded mb-2",
+                        id=list_hash_id,
+                    ):
+                        with tag("div", klass="list-group"):
+                            for entry, url in zip(mal_ids, db["anilist"]):
+                                with tag(
+                                    "a",
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                    klass="list-group-item list-group-item-action",
+                                    href=str(url),
+                                ):
+                                    if download_names:
+                                        text(mal_names.get(int(entry)))
+                                    else:
+                                        text(entry)
+            # insert hidden rows for youtube/vimeo
+        if s.streaming is not None:
+            for vid in s.streaming:
+                # multiple youtube videos
+                if "youtube" in vid and isinstance(vid["youtube"], list):
+                    list_hash_id = ids.list_id(s, vid["youtube"], octothorpe=False)
+                    with tag(
+                        "div",
+                        klass="collapse rounded mb-2",
+                        id=list_hash_id,
+                    ):
+                        with tag("div", klass="list-group"):
+                            # check if episodes have names [
+                            # correlates to MAL entries 1-1 ]
+                            assert s.database is not None
+                            for db in s.database:
+                                if "mal" in db and isinstance(db["mal"], list):
+                                    for mal_id, v in zip(db["mal"], vid["youtube"]):
+                                        with tag(
+                                            "a",
+                                            ("target", "_blank"),
+                                            ("rel", "norefferer"),
+                                            klass="list-group-item list-group-item-action",
+                                            href=join_urls(
+                                                "https://youtu.be",
+                                                str(v),
+                                            ),
+                                        ):
+                                            text(mal_names.get(int(mal_id)))
+                                elif "anilist" in db and isinstance(
+                                    db["anilist"], list
+                                ):
+                                    pass  # same entries as the MAL list
+                                else:  # else use 'episode 1,2,3' as link text
+                                    for i, v in enumerate(vid["youtube"], 1):
+                                        with tag(
+                                            "a",
+                                            ("target", "_blank"),
+                                            ("rel", "norefferer"),
+                                            klass="list-group-item list-group-item-action",
+                                            href=join_urls(
+                                                "https://youtu.be",
+                                                str(v),
+                                            ),
+                                        ):
+                                            text(f"Episode {i}")
+                # multiple vimeo videos
+                elif "vimeo" in vid and isinstance(vid["vimeo"], list):
+                    list_hash_id = ids.list_id(s, vid["vimeo"], octothorpe=False)
+                    with tag(
+                        "div",
+                        klass="collapse rounded mb-2",
+                        id=list_hash_id,
+                    ):
+                        with tag("div", klass="list-group"):
+                            for i, v in enumerate(vid["vimeo"], 1):
+                                with tag(
+                                    "a",
+                                    ("target", "_blank"),
+                                    ("rel", "norefferer"),
+                                    klass="list-group-item list-group-item-action",
+                                    href=join_urls("https://vimeo.com", str(v)),
+                                ):
+                                    text(f"Episode {i}")
+    return str(doc.getvalue())
+
+
+@lru_cache(maxsize=None)
+def date_badge(date: datetime.date, level: Optional[int]) -> str:
+    """The date badge, indented to 'level' if given"""
+    doc, tag, text = Doc().tagtext()
+    with tag("span", klass="badge badge-info"):
+        text(str(date))
+    if level is None:
+        return str(doc.getvalue())
+    return html_writer.indent_fragment(doc.getvalue(), level)
+
+
+def place_date_badge(
+    row: RenderedRow, list_order: constants.Order, pretty: bool = False
+) -> str:
+    """pretty: whether the row has been indented by html_writer.indent_fragment"""
+    s, markup = row
+    if not pretty:
+        badge = date_badge(s.date, None) if list_order == constants.Order.DATE else ""
+        return markup.replace(DATE_BADGE, badge, 1)
+    # the placeholder is on its own line, indent the badge to match
+    i = markup.index(DATE_BADGE)
+    line_start = markup.rindex("\n", 0, i)
+    badge = ""
+    if list_order == constants.Order.DATE:
+        level = (i - line_start - 1) // len(html_writer.INDENTATION)
+        badge = date_badge(s.date, level)
+    return markup[:line_start] + badge + markup[i + len(DATE_BADGE) :]
+
+
+def render_rows(
     sources: List[Source],
-    list_order: constants.Order,
-    mal_cache: Cache,
+    mal_names: Names,
     download_names: bool,
+    fragments: Optional[FragmentCache] = None,
+    create: Callable[[Source, Names, bool, IdRegistry], str] = create_row,
+    level: Optional[int] = None,
+) -> List[RenderedRow]:
+    """
+    Renders each source once, so the rows can be shared between orderings.
+    Doesn't make any requests, see enrich_sources
+
+    create is the function which renders a single row, see templates.py
+    If level is given, rows are indented to be written at that depth
+
+    Raises a ValueError if two element ids in the list collide
+    """
+    # even if every row is cached, so collisions still fail the build
+    ids = IdRegistry(sources)
+    rows: List[RenderedRow] = []
+    for s in sources:
+        key = row_cache_key(s, mal_names, download_names, level, ids.key(s))
+        row = fragments.get(key) if fragments is not None else None
+        if row is None:
+            row = create(s, mal_names, download_names, ids)
+            if level is not None:
+                row = html_writer.indent_fragment(row, level)
+            if fragments is not None:
+                fragments.set(key, row)
+        rows.append((s, row))
+    return rows
+
+
+def page_skeleton(
+    list_order: constants.Order,
+    only: Optional[Tag] = None,
+    page: Optional[Page] = None,
 ) -> str:
-    """Creates the table from YAML"""
+    """
+    Creates the page, with a placeholder where the rows go
+    only: the tag this page lists, if it isn't the full list
+    page: if the list is paginated, adds links to the pages around this one
+    """
     doc, tag, text = Doc().tagtext()
     doc.asis("<!DOCTYPE html>")
     with tag("html", ("lang", "en")):
         with tag("head"):
             with tag("title"):
                 text(constants.SHORT_NAME)
+                if only is not None:
+                    text(f" - {only.value}")
             doc.asis("<!-- Required meta tags -->")
             doc.asis('<meta charset="utf-8">')
             doc.asis(
@@ -115,578 +975,81 @@ def create_page(
             doc.asis(
                 '<link href="https://fonts.googleapis.com/css?family=Lato" rel="stylesheet">'
             )
+            if page is not None:
+                for rel, name in (("prev", page.prev), ("next", page.next)):
+                    if name is not None:
+                        doc.asis(f'<link rel="{rel}" href="{page_href(name)}">')
         with tag("body"):
             doc.asis("<!-- navbar -->")
-            doc.asis(
-                generate_navbar.navbar(active=constants.LIST_TAB, sorttab=list_order)
-            )
+            if only is None:
+                navbar = generate_navbar.navbar(
+                    active=constants.LIST_TAB, sorttab=list_order
+                )
+            else:
+                navbar = generate_navbar.navbar(
+                    active=constants.LIST_TAB,
+                    sorttab=list_order,
+                    rec_page=f"./{tag_page(only, constants.Order.REC)}",
+                    date_page=f"./{tag_page(only, constants.Order.DATE)}",
+                )
+            doc.asis(navbar)
             doc.asis("<!-- note -->")
             with tag("div", ("class", "container py-3 mb-0"), ("id", "note")):
                 with tag("p", ("class", "text-center mb-0")):
-                    text("This is not an exhaustive list, just my recommendations. ")
-                    text("For my personal favorite visual aesthetics, see ")
-                    with tag("a", href="https://myanimelist.net/stacks/610"):
-                        text("here")
+                    if only is None:
+                        text(
+                            "This is not an exhaustive list, just my recommendations. "
+                        )
+                        text("For my personal favorite visual aesthetics, see ")
+                        with tag("a", href="https://myanimelist.net/stacks/610"):
+                            text("here")
+                    else:
+                        text(f"Shorts tagged '{only.value.lower()}'. ")
+                        with tag(
+                            "a",
+                            href="./"
+                            if list_order == constants.Order.REC
+                            else "./newest",
+                        ):
+                            text("See the full list")
 
+            doc.asis("<!-- search -->")
+            with tag("div", ("class", "container pt-3"), ("id", "search-container")):
+                doc.stag(
+                    "input",
+                    ("type", "search"),
+                    ("id", "search"),
+                    ("class", "form-control"),
+                    ("placeholder", "Search"),
+                    ("aria-label", "Search"),
+                    ("autocomplete", "off"),
+                )
+                with tag("div", ("class", "list-group"), ("id", "search-results")):
+                    text("")
             doc.asis("<!-- list -->")
             with tag("main", klass="container", id="main-container"):
-                sources = sort_list(sources, list_order)
-                for s in sources:
-                    with tag("div", ("class", "anime-row-container")):
-                        with tag(
-                            "div", klass="row anime-row align-items-center border"
-                        ):  # row for each anime
-                            # name/tags/info button
-                            with tag("div", klass="col-sm"):
-                                # name
-                                with tag("h6"):
-                                    text(str(s.name))
-                                    # tags
-                                    for t in sorted(s.tags, key=lambda t: t.value):
-                                        tag_slug = (
-                                            t.value.lower().strip().replace(" ", "-")
-                                        )
-                                        with tag("span", klass=f"badge tag {tag_slug}"):
-                                            with tag(
-                                                "a",
-                                                ("href", "javascript:void(0)"),
-                                                ("class", "badge-link"),
-                                                ("data-toggle", "tooltip"),
-                                                (
-                                                    "data-original-title",
-                                                    f"filter page to shorts tagged '{t.value.lower()}'",
-                                                ),
-                                                (
-                                                    "onclick",
-                                                    f"filterBadge('{tag_slug}', this)",
-                                                ),
-                                            ):
-                                                text(t.value)
-                                    if list_order == constants.Order.DATE:
-                                        with tag("span", klass="badge badge-info"):
-                                            text(str(s.date))
-                                    # if this has extra info
-                                    if s.extra_info is not None:
-                                        with tag(
-                                            "a",
-                                            ("role", "button"),
-                                            ("class", "more-info-expand ml-2"),
-                                            (
-                                                "href",
-                                                create_id(
-                                                    name=f"{s.name}-extra-info",
-                                                    octothorpe=True,
-                                                ),
-                                            ),
-                                            ("aria-expanded", "false"),
-                                            ("data-toggle", "collapse"),
-                                        ):
-                                            text("ⓘ")
-
-                            # time (durations/episodes)
-                            if s.duration is not None and s.episodes is not None:
-                                dur, eps = s.duration, s.episodes
-                                with tag("div", ("class", "time col-md-1")):
-                                    if eps == 1:
-                                        with tag("span", klass="badge"):
-                                            text(str(format_duration(dur)))
-                                    elif eps == 0:  # unknown ep count
-                                        with tag("span", klass="badge"):
-                                            text(f"{format_duration(dur)} x ? eps")
-                                    else:
-                                        with tag("span", klass="badge"):
-                                            # display as multiple episodes
-                                            text(f"{format_duration(dur)} x {eps} eps")
-                            else:
-                                print("Undefined duration/episodes:", s)
-
-                            # buttons
-                            with tag(
-                                "div",
-                                klass="circular-buttons-container col-md-4 col-lg-3 col-xl-3",
-                            ):
-                                # databases
-                                if s.database is not None:
-                                    for db in s.database:
-                                        # MAL
-                                        if "mal" in db:
-                                            # if multiple entries
-                                            if isinstance(db["mal"], list):
-                                                # place button
-                                                list_hash_id = create_id(
-                                                    name="{}{}".format(
-                                                        str(s.name),
-                                                        "".join(
-                                                            list(map(str, db["mal"]))
-                                                        ),
-                                                    ),
-                                                    octothorpe=True,
-                                                )
-                                                with tag(
-                                                    "a",
-                                                    ("role", "button"),
-                                                    ("href", list_hash_id),
-                                                    ("aria-expanded", "false"),
-                                                    ("data-toggle", "collapse"),
-                                                ):
-                                                    doc.stag(
-                                                        "img",
-                                                        (
-                                                            "src",
-                                                            "./images/mal_icon.png",
-                                                        ),
-                                                        (
-                                                            "alt",
-                                                            f"{s.name} (MyAnimeList)",
-                                                        ),
-                                                        ("class", "rounded-circle"),
-                                                    )
-
-                                            else:
-                                                # if single entry
-                                                mal_url = join_urls(
-                                                    "https://myanimelist.net",
-                                                    "anime",
-                                                    str(db["mal"]),
-                                                )
-                                                with tag(
-                                                    "a",
-                                                    ("href", mal_url),
-                                                    ("target", "_blank"),
-                                                    ("rel", "norefferer"),
-                                                ):
-                                                    doc.stag(
-                                                        "img",
-                                                        (
-                                                            "src",
-                                                            """./images/mal_icon.png""",
-                                                        ),
-                                                        (
-                                                            "alt",
-                                                            f"{s.name} (MyAnimeList)",
-                                                        ),
-                                                        ("class", "rounded-circle"),
-                                                    )
-                                        # add elifs for other databases here
-                                        # (if expanding later)
-                                        elif "anilist" in db:
-                                            anilist_link = db["anilist"]
-                                            assert isinstance(anilist_link, str)
-                                            with tag(
-                                                "a",
-                                                ("href", anilist_link),
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                            ):
-                                                doc.stag(
-                                                    "img",
-                                                    (
-                                                        "src",
-                                                        """./images/anilist.png""",
-                                                    ),
-                                                    (
-                                                        "alt",
-                                                        f"{s.name} (AniList)",
-                                                    ),
-                                                    (
-                                                        "class",
-                                                        "rounded-circle anilist-circle",
-                                                    ),
-                                                )
-
-                                        else:
-                                            print(
-                                                "Warning, found unknown database:", db
-                                            )
-
-                                # streaming
-                                if s.streaming is not None:
-                                    for vid in s.streaming:
-                                        if "youtube" in vid:
-                                            # if list of videos
-                                            if isinstance(vid["youtube"], list):
-                                                # print("Creating list for", s['name'])
-                                                list_hash_id = create_id(
-                                                    name="{}{}".format(
-                                                        str(s.name),
-                                                        "".join(
-                                                            list(
-                                                                map(str, vid["youtube"])
-                                                            )
-                                                        ),
-                                                    ),
-                                                    octothorpe=True,
-                                                )
-                                                with tag(
-                                                    "a",
-                                                    ("role", "button"),
-                                                    ("href", list_hash_id),
-                                                    ("aria-expanded", "false"),
-                                                    ("data-toggle", "collapse"),
-                                                ):
-                                                    doc.stag(
-                                                        "img",
-                                                        (
-                                                            "src",
-                                                            "./images/yt_icon.png",
-                                                        ),
-                                                        ("alt", f"{s.name} (Youtube)"),
-                                                        ("class", "rounded-circle"),
-                                                    )
-                                                    if s.cc:
-                                                        with tag(
-                                                            "span",
-                                                            ("class", "badge cc"),
-                                                            ("data-toggle", "tooltip"),
-                                                            (
-                                                                "data-original-title",
-                                                                "Videos have Subtitles",
-                                                            ),
-                                                        ):
-                                                            text("CC")
-                                            else:
-                                                # single video
-                                                with tag(
-                                                    "a",
-                                                    ("target", "_blank"),
-                                                    ("rel", "norefferer"),
-                                                    href=join_urls(
-                                                        "https://youtu.be"
-                                                        if "playlist"
-                                                        not in str(vid["youtube"])
-                                                        else "https://youtube.com",
-                                                        str(vid["youtube"]),
-                                                    ),
-                                                ):
-                                                    doc.stag(
-                                                        "img",
-                                                        (
-                                                            "src",
-                                                            "./images/yt_icon.png",
-                                                        ),
-                                                        ("alt", f"{s.name} (Youtube)"),
-                                                        ("class", "rounded-circle"),
-                                                    )
-                                                    if s.cc:
-                                                        with tag(
-                                                            "span",
-                                                            ("class", "badge cc"),
-                                                            ("data-toggle", "tooltip"),
-                                                            (
-                                                                "data-original-title",
-                                                                "Video has Subtitles",
-                                                            ),
-                                                        ):
-                                                            text("CC")
-
-                                        elif "vimeo" in vid:
-                                            # if list of videos
-                                            if isinstance(vid["vimeo"], list):
-                                                list_hash_id = create_id(
-                                                    name="{}{}".format(
-                                                        str(s.name),
-                                                        "".join(
-                                                            list(map(str, vid["vimeo"]))
-                                                        ),
-                                                    ),
-                                                    octothorpe=True,
-                                                )
-                                                with tag(
-                                                    "a",
-                                                    ("role", "button"),
-                                                    ("href", list_hash_id),
-                                                    ("aria-expanded", "false"),
-                                                    ("data-toggle", "collapse"),
-                                                ):
-                                                    doc.stag(
-                                                        "img",
-                                                        (
-                                                            "src",
-                                                            "./images/vimeo_icon.png",
-                                                        ),
-                                                        (
-                                                            "alt",
-                                                            f"{s.name} (Vimeo)",
-                                                        ),
-                                                        ("class", "rounded-circle"),
-                                                    )
-                                            else:
-                                                # single video
-                                                with tag(
-                                                    "a",
-                                                    ("target", "_blank"),
-                                                    ("rel", "norefferer"),
-                                                    href=join_urls(
-                                                        "https://vimeo.com",
-                                                        str(vid["vimeo"]),
-                                                    ),
-                                                ):
-                                                    doc.stag(
-                                                        "img",
-                                                        (
-                                                            "src",
-                                                            "./images/vimeo_icon.png",
-                                                        ),
-                                                        ("alt", f"{s.name} (Vimeo)"),
-                                                        ("class", "rounded-circle"),
-                                                    )
-                                        elif "crunchyroll" in vid:
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                href=join_urls(
-                                                    "http://www.crunchyroll.com",
-                                                    str(vid["crunchyroll"]),
-                                                ),
-                                            ):
-                                                doc.stag(
-                                                    "img",
-                                                    (
-                                                        "src",
-                                                        "./images/cr_icon.png",
-                                                    ),
-                                                    ("alt", f"{s.name} (Crunchyroll)"),
-                                                    ("class", "rounded-circle"),
-                                                )
-                                        elif "netflix" in vid:
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                href=join_urls(
-                                                    "https://www.netflix.com",
-                                                    "title",
-                                                    str(vid["netflix"]),
-                                                ),
-                                            ):
-                                                doc.stag(
-                                                    "img",
-                                                    (
-                                                        "src",
-                                                        "./images/netflix_icon.png",
-                                                    ),
-                                                    ("alt", f"{s.name} (Netflix)"),
-                                                    ("class", "rounded-circle"),
-                                                )
-                                        elif "funimation" in vid:
-                                            with tag(
-                                                "a",
-                                                href=join_urls(
-                                                    "https://www.funimation.com",
-                                                    "shows",
-                                                    str(vid["funimation"]),
-                                                ),
-                                            ):
-                                                doc.stag(
-                                                    "img",
-                                                    (
-                                                        "src",
-                                                        "./images/fn_icon.png",
-                                                    ),
-                                                    ("alt", f"{s.name} (Funimation)"),
-                                                    ("class", "rounded-circle"),
-                                                    ("target", "_blank"),
-                                                    ("rel", "norefferer"),
-                                                )
-                                        elif "hidive" in vid:
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                href=join_urls(
-                                                    "https://www.hidive.com",
-                                                    "tv",
-                                                    str(vid["hidive"]),
-                                                ),
-                                            ):
-                                                doc.stag(
-                                                    "img",
-                                                    (
-                                                        "src",
-                                                        "./images/hidive_icon.png",
-                                                    ),
-                                                    ("alt", f"{s.name} (Hidive)"),
-                                                    ("class", "rounded-circle"),
-                                                )
-
-                                        elif "twitter" in vid:
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                href=join_urls(str(vid["twitter"])),
-                                            ):
-                                                doc.stag(
-                                                    "img",
-                                                    (
-                                                        "src",
-                                                        "./images/twitter.svg",
-                                                    ),
-                                                    ("alt", f"{s.name} (Twitter)"),
-                                                    ("class", "rounded-circle"),
-                                                )
-                                        elif "website" in vid:
-                                            assert isinstance(vid, dict)
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                href=vid["website"],
-                                            ):
-                                                doc.stag(
-                                                    "img",
-                                                    (
-                                                        "src",
-                                                        "./images/link.png",
-                                                    ),
-                                                    (
-                                                        "alt",
-                                                        "website",
-                                                    ),
-                                                    ("class", "rounded-circle"),
-                                                    ("target", "_blank"),
-                                                    ("rel", "norefferer"),
-                                                )
-                                        else:
-                                            print(
-                                                "Warning, unfound 'source' in streaming:",
-                                                vid,
-                                            )
-
-                        # HIDDEN ROWS
-                        # insert hidden row for extra info if ⓘ exists
-                        if s.extra_info is not None:
-                            with tag(
-                                "div",
-                                klass="collapse border rounded-bottom border-top-0 mb-1",
-                                id=create_id(
-                                    name=f"{s.name}-extra-info",
-                                    octothorpe=False,
-                                ),
-                            ):
-                                with tag("p", klass="pl-2 mb-0"):
-                                    text(str(s.extra_info))
-
-                        # insert hidden row for databases
-                        if s.database is not None:
-                            for db in s.database:
-                                if "mal" in db and isinstance(db["mal"], list):
-                                    list_hash_id = create_id(
-                                        name="{}{}".format(
-                                            str(s.name),
-                                            "".join(list(map(str, db["mal"]))),
-                                        ),
-                                        octothorpe=False,
-                                    )
-                                    with tag(
-                                        "div",
-                                        klass="collapse rounded mb-2",
-                                        id=list_hash_id,
-                                    ):
-                                        with tag("div", klass="list-group"):
-                                            for entry in db["mal"]:
-                                                with tag(
-                                                    "a",
-                                                    ("target", "_blank"),
-                                                    ("rel", "norefferer"),
-                                                    klass="list-group-item list-group-item-action",
-                                                    href=join_urls(
-                                                        "https://myanimelist.net",
-                                                        "anime",
-                                                        str(entry),
-                                                    ),
-                                                ):
-                                                    if download_names:
-                                                        text(mal_cache.get(int(entry)))
-                                                    else:
-                                                        text(entry)
-                            # insert hidden rows for youtube/vimeo
-                        if s.streaming is not None:
-                            for vid in s.streaming:
-                                # multiple youtube videos
-                                if "youtube" in vid and isinstance(
-                                    vid["youtube"], list
+                doc.asis(html_writer.FRAGMENTS)
+            if page is not None:
+                doc.asis("<!-- pages -->")
+                with tag("nav", ("class", "container py-3"), ("aria-label", "pages")):
+                    with tag("ul", klass="pagination justify-content-center mb-0"):
+                        for label, rel, name in (
+                            ("Previous", "prev", page.prev),
+                            ("Next", "next", page.next),
+                        ):
+                            if name is None:
+                                with tag("li", klass="page-item disabled"):
+                                    with tag("span", klass="page-link"):
+                                        text(label)
+                                continue
+                            with tag("li", klass="page-item"):
+                                with tag(
+                                    "a",
+                                    ("class", "page-link"),
+                                    ("rel", rel),
+                                    ("href", page_href(name)),
                                 ):
-                                    list_hash_id = create_id(
-                                        name="{}{}".format(
-                                            str(s.name),
-                                            "".join(list(map(str, vid["youtube"]))),
-                                        ),
-                                        octothorpe=False,
-                                    )
-                                    with tag(
-                                        "div",
-                                        klass="collapse rounded mb-2",
-                                        id=list_hash_id,
-                                    ):
-                                        with tag("div", klass="list-group"):
-                                            # check if episodes have names [
-                                            # correlates to MAL entries 1-1 ]
-                                            assert s.database is not None
-                                            for db in s.database:
-                                                if "mal" in db and isinstance(
-                                                    db["mal"], list
-                                                ):
-                                                    for mal_id, v in zip(
-                                                        db["mal"], vid["youtube"]
-                                                    ):
-                                                        with tag(
-                                                            "a",
-                                                            ("target", "_blank"),
-                                                            ("rel", "norefferer"),
-                                                            klass="list-group-item list-group-item-action",
-                                                            href=join_urls(
-                                                                "https://youtu.be",
-                                                                str(v),
-                                                            ),
-                                                        ):
-                                                            text(
-                                                                mal_cache.get(
-                                                                    int(mal_id)
-                                                                )
-                                                            )
-                                                else:  # else use 'episode 1,2,3' as link text
-                                                    for i, v in enumerate(
-                                                        vid["youtube"], 1
-                                                    ):
-                                                        with tag(
-                                                            "a",
-                                                            ("target", "_blank"),
-                                                            ("rel", "norefferer"),
-                                                            klass="list-group-item list-group-item-action",
-                                                            href=join_urls(
-                                                                "https://youtu.be",
-                                                                str(v),
-                                                            ),
-                                                        ):
-                                                            text(f"Episode {i}")
-                                # multiple vimeo videos
-                                elif "vimeo" in vid and isinstance(vid["vimeo"], list):
-                                    list_hash_id = create_id(
-                                        name="{}{}".format(
-                                            str(s.name),
-                                            "".join(list(map(str, vid["vimeo"]))),
-                                        ),
-                                        octothorpe=False,
-                                    )
-                                    with tag(
-                                        "div",
-                                        klass="collapse rounded mb-2",
-                                        id=list_hash_id,
-                                    ):
-                                        with tag("div", klass="list-group"):
-                                            for i, v in enumerate(vid["vimeo"], 1):
-                                                with tag(
-                                                    "a",
-                                                    ("target", "_blank"),
-                                                    ("rel", "norefferer"),
-                                                    klass="list-group-item list-group-item-action",
-                                                    href=join_urls(
-                                                        "https://vimeo.com", str(v)
-                                                    ),
-                                                ):
-                                                    text(f"Episode {i}")
+                                    text(label)
             # footer
             doc.asis("<!-- footer -->")
             with tag("footer", ("class", "bg-dark footer")):
@@ -699,7 +1062,8 @@ def create_page(
             doc.asis(
                 """<script src="https://code.jquery.com/jquery-3.4.1.slim.min.js" integrity="sha384-J6qa4849blE2+poT4WnyKhv5vZF5SrPo0iEjwBvKU7imGFAV0wwj1yYfoRSJoZ+n" crossorigin="anonymous"></script>
     <script src="https://cdn.jsdelivr.net/npm/popper.js@1.16.0/dist/umd/popper.min.js" integrity="sha384-Q6E9RHvbIyZFJoft+2mJbHaEWldlvI9IOYy5n3zV9zzTtmI3UksdQRVvoxMfooAo" crossorigin="anonymous"></script>
-    <script src="https://stackpath.bootstrapcdn.com/bootstrap/4.4.1/js/bootstrap.min.js" integrity="sha384-wfSDF2E50Y2D1uUdj0O3uMBJnjuUD4Ih7YwaYd1iqfktj0Uod8GCExl3Og8ifwB6" crossorigin="anonymous"></script>"""
+    <script src="https://stackpath.bootstrapcdn.com/bootstrap/4.4.1/js/bootstrap.min.js" integrity="sha384-wfSDF2E50Y2D1uUdj0O3uMBJnjuUD4Ih7YwaYd1iqfktj0Uod8GCExl3Og8ifwB6" crossorigin="anonymous"></script>
+    <script src="./js/search.js" defer></script>"""
             )
             with tag("script"):
                 doc.asis(
@@ -743,58 +1107,141 @@ document.addEventListener('DOMContentLoaded', function() {
     $('#choiceform').submit();
   });
 
-  // check url to filter by tag onload
-  if (window.location.hash.slice(1)) {
-    filterBadge(window.location.hash.slice(1), null)
+  // check url to filter by tag onload (the hash can also be the id of a row, from the search)
+  const hash = window.location.hash.slice(1)
+  if (hash && document.querySelector(`span.badge.tag.${CSS.escape(hash)}`) !== null) {
+    filterBadge(hash, null)
   }
 }, false);
 
 """
                 )
-    return str(indent(doc.getvalue(), indent_text=True))
+    return str(doc.getvalue())
+
+
+def write_page(
+    out: TextIO,
+    rows: List[RenderedRow],
+    list_order: constants.Order,
+    pretty: bool = True,
+    only: Optional[Tag] = None,
+    page: Optional[Page] = None,
+) -> None:
+    """
+    Writes the page to out, row by row. If pretty, the rows
+    have to be rendered with render_rows(..., level=ROW_LEVEL)
+
+    If only is given, the page lists just the rows with that tag.
+    If page is given (see paginate), just the rows on that page
+    """
+    if only is not None:
+        rows = [row for row in rows if only in row[0].tags]
+    if page is not None:
+        rows = page.rows
+    html_writer.write_page(
+        out,
+        page_skeleton(list_order, only, page),
+        (
+            place_date_badge(row, list_order, pretty)
+            for row in sort_rows(rows, list_order)
+        ),
+        ROW_LEVEL if pretty else None,
+    )
+
+
+def create_page(
+    rows: List[RenderedRow], list_order: constants.Order, pretty: bool = True
+) -> str:
+    """Creates the table from YAML"""
+    buf = io.StringIO()
+    write_page(buf, rows, list_order, pretty)
+    return buf.getvalue()
 
 
 def fetch_anilist_sources(sources: List[Source]) -> List[Source]:
     ani = AniListNames()
+    mal_ids: List[int] = []
+    for src in sources:
+        for db in src.database or []:
+            if "mal" in db:
+                ids = db["mal"]
+                mal_ids.extend(map(int, ids) if isinstance(ids, list) else [int(ids)])
+    # resolve every id up front, so they can be requested in batches
+    ani.fetch_many(mal_ids)
     for src in sources:
         if src.database:
-            for db in src.database:
-                for dbk in list(db.keys()):
-                    if dbk == "mal":
-                        id_or_list_of_ids = db[dbk]
-                        if isinstance(id_or_list_of_ids, list):
-                            # dont support this for now, complicates stuff
-                            pass
-                        else:
-                            assert isinstance(id_or_list_of_ids, int)
-                            mal_id = id_or_list_of_ids
-                            anilist_id = ani.get(mal_id)
-                            if anilist_id is not None:
-                                src.database.append({"anilist": anilist_id})
-    ani.write()
+            for i, db in enumerate(list(src.database)):
+                if "mal" in db:
+                    id_or_list_of_ids = db["mal"]
+                    if isinstance(id_or_list_of_ids, list):
+                        urls = [ani.get(int(mal_id)) for mal_id in id_or_list_of_ids]
+                        # only link the list if every entry is on AniList
+                        if all(url is not None for url in urls):
+                            src.database.append(
+                                {"anilist": [str(u) for u in urls], MAL_INDEX: i}
+                            )
+                    else:
+                        anilist_id = ani.get(int(id_or_list_of_ids))
+                        if anilist_id is not None:
+                            src.database.append({"anilist": anilist_id})
     return sources
 
 
-def main(do_download_names: bool = True) -> None:
-    # Read in YAML Sources
-    with open(constants.LIST_SOURCES) as yaml_src:
-        sources_raw = yaml.load(yaml_src, Loader=yaml.FullLoader)
-    sources: List[Source] = [Source.parse_obj(s) for s in sources_raw]
+def enrich_sources(
+    sources: List[Source], mal_cache: Cache, download_names: bool
+) -> List[Source]:
+    """
+    Adds AniList links to sources and downloads every MAL name
+    the rows will need, so rendering them doesn't make any requests
+    """
     sources = fetch_anilist_sources(sources)
+    # each id once, downloaded concurrently
+    failed = mal_cache.fetch_many(
+        {mal_id for s in sources for mal_id in row_mal_ids(s, download_names)}
+    )
+    if failed:
+        print(f"Couldn't download names for MAL IDs {sorted(failed)}")
+    mal_cache.update_json_file()
+    return sources
+
+
+def report_missing(mal_names: Names) -> None:
+    if mal_names.missing:
+        print(
+            f"No name downloaded for MAL IDs {sorted(mal_names.missing)}, "
+            "rendered their IDs instead"
+        )
+
+
+def load_sources(strict: bool = False) -> List[Source]:
+    # Read in YAML Sources
+    return load_models(constants.LIST_SOURCES, Source, strict=strict)
+
+
+def main(do_download_names: bool = True) -> None:
     mal_cache = Cache()  # fetch MAL names
+    sources = enrich_sources(load_sources(), mal_cache, do_download_names)
+    mal_names = mal_cache.names()
+    fragments = FragmentCache()
+    rows = render_rows(
+        sources, mal_names, do_download_names, fragments, level=ROW_LEVEL
+    )
+    print(f"Rendered {fragments.misses} rows, reused {fragments.hits} cached rows")
+    report_missing(mal_names)
     # write out html file - ordered by recommendation
     with open(f"{constants.OUTPUT_DIR}/index.html", "w") as write_html_file:
         print("Generated index.html")
-        write_html_file.write(
-            create_page(sources, constants.Order.REC, mal_cache, do_download_names)
-        )
+        write_page(write_html_file, rows, constants.Order.REC)
     # write out html file - ordered by date
     with open(f"{constants.OUTPUT_DIR}/newest.html", "w") as write_newest_html:
         print("Generated newest.html")
-        write_newest_html.write(
-            create_page(sources, constants.Order.DATE, mal_cache, do_download_names)
-        )
-    mal_cache.update_json_file()
+        write_page(write_newest_html, rows, constants.Order.DATE)
+    # and a page for each tag, in both orders
+    for t in Tag:
+        for order in constants.Order:
+            with open(f"{constants.OUTPUT_DIR}/{tag_page(t, order)}.html", "w") as f:
+                write_page(f, rows, order, only=t)
+    fragments.write()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Any
 
 from yattag import Doc, indent  # type: ignore[import]
@@ -6,12 +7,16 @@ from . import constants
 # generates the navbar, and forms for the top of the page.
 
 
+@lru_cache(maxsize=None)
 def navbar(active: str, **kwargs: Any) -> str:
-    """'active' determines which tab is highlighted"""
+    """'active' determines which tab is highlighted, the result is cached"""
     if not kwargs:
         sorttab = None
     else:
         sorttab = kwargs["sorttab"]
+    # the pages the order buttons link to
+    rec_page = kwargs.get("rec_page", "./")
+    date_page = kwargs.get("date_page", "./newest")
     doc, tag, text = Doc().tagtext()
     with tag(
         "nav",
@@ -86,7 +91,9 @@ def navbar(active: str, **kwargs: Any) -> str:
                             ("class", "btn-group ml-1"),
                             ("role", "group"),
                         ):
-                            with tag("form", ("action", "./"), ("class", "btn-group")):
+                            with tag(
+                                "form", ("action", rec_page), ("class", "btn-group")
+                            ):
                                 with tag(
                                     "button",
                                     (
@@ -100,7 +107,7 @@ def navbar(active: str, **kwargs: Any) -> str:
                                 ):
                                     text("Recommendation")
                             with tag(
-                                "form", ("action", "./newest"), ("class", "btn-group")
+                                "form", ("action", date_page), ("class", "btn-group")
                             ):
                                 with tag(
                                     "button",
@@ -1,17 +1,20 @@
+import io
 import sys
 from os import path
-from pathlib import Path
-from typing import TypeVar, List, Iterator, Optional
+from functools import lru_cache
+from typing import Callable, List, Optional, TextIO, Tuple
 
 
-import yaml
 from pydantic import BaseModel
-from yattag import Doc, indent  # type: ignore[import]
-from PIL import Image  # type: ignore[import]
+from yattag import Doc  # type: ignore[import]
 
 from . import constants
 from . import generate_navbar
+from . import html_writer
 from .generate_list import join_urls
+from .image_index import ImageIndex
+from .image_variants import VARIANTS_URL, variant_name, variant_widths
+from .sources import load_models
 
 
 class Person(BaseModel):
@@ -22,29 +25,145 @@ class Person(BaseModel):
     youtube: Optional[str]
 
 
+# cards are inside html > body > main > div.card-columns
+CARD_LEVEL = 4
+# how wide the card images are displayed, see the column-counts in people.css
+IMAGE_SIZES = "(max-width: 575px) 100vw, (max-width: 767px) 270px, 240px"
+
+
 def image_path(filename: str) -> str:
     return path.join("./images/people", filename)
 
 
+@lru_cache(maxsize=None)
+def image_index() -> ImageIndex:
+    return ImageIndex()
+
+
 def get_ratio_image_from_relative_path(filename: str) -> str:
-    """from the html_generators directory, gets the ratio of height/width for an image in the people directory"""
-    p = Path(__file__).parent.parent / "static/images/people" / filename
-    assert p.exists(), str(p)
-    with Image.open(p) as img:
-        width, height = img.size
-        return "{}%".format(height / width * 100)
+    """gets the ratio of height/width for an image in the people directory, from the image index"""
+    return image_index().get(filename).ratio
 
 
-T = TypeVar("T")
+def image_srcsets(filename: str) -> Tuple[str, str]:
+    """srcset of the WebP variants and of the original format, see image_variants.py"""
+    width = image_index().get(filename).width
+    widths = variant_widths(width)
+    webp = [
+        f"{path.join(VARIANTS_URL, variant_name(filename, w, '.webp'))} {w}w"
+        for w in widths + [width]
+    ]
+    original = [
+        f"{path.join(VARIANTS_URL, variant_name(filename, w))} {w}w" for w in widths
+    ]
+    original.append(f"{image_path(filename)} {width}w")
+    return ", ".join(webp), ", ".join(original)
 
 
-def chunk_list(lst: List[T], chunk_size: int) -> Iterator[List[T]]:
-    """Return chunk_size'd lists from the large list."""
-    for i in range(0, len(lst), chunk_size):
-        yield lst[i : i + chunk_size]
+def create_person_card(c: Person) -> str:
+    """Creates the (unindented) markup for a single card on the people page"""
+    doc, tag, text = Doc().tagtext()
+    with tag("div", klass="card"):
+        with tag(
+            "div",
+            ("class", "image-container"),
+            (
+                "style",
+                (f"padding-bottom:{get_ratio_image_from_relative_path(c.image)};"),
+            ),
+        ):
+            webp, original = image_srcsets(c.image)
+            with tag("picture"):
+                doc.stag(
+                    "source",
+                    ("type", "image/webp"),
+                    ("srcset", webp),
+                    ("sizes", IMAGE_SIZES),
+                )
+                doc.stag(
+                    "img",
+                    ("class", "card-img-top img-fluid"),
+                    ("src", image_path(c.image)),
+                    ("srcset", original),
+                    ("sizes", IMAGE_SIZES),
+                    alt=c.name,
+                )
+        with tag("div", klass="card-block"):
+            with tag("h4", klass="card-title"):
+                text(c.name)
+            with tag("div", klass="card-text"):
+                for other_link in sorted(
+                    list(
+                        {
+                            k: getattr(c, k)
+                            for k, v in c.dict().items()
+                            if k not in ["name", "image"] and v is not None
+                        }
+                    )
+                ):
+                    o_link = getattr(c, other_link)
+                    assert o_link is not None, str(c) + f"using {other_link}"
+                    if other_link == "mal":
+                        with tag(
+                            "a",
+                            ("target", "_blank"),
+                            ("rel", "norefferer"),
+                            klass="badge badge-pill person-link badge-secondary",
+                            href=join_urls(
+                                "https://myanimelist.net",
+                                "people",
+                                o_link,
+                            ),
+                        ):
+                            with tag("span", klass="moveup"):
+                                text("mal")
+                    elif other_link == "website":
+                        with tag(
+                            "a",
+                            ("target", "_blank"),
+                            ("rel", "norefferer"),
+                            klass="badge badge-pill person-link badge-secondary movetext",
+                            href=o_link,
+                        ):
+                            with tag("span", klass="moveup"):
+                                text("website")
+                    elif other_link == "vimeo":
+                        with tag(
+                            "a",
+                            ("target", "_blank"),
+                            ("rel", "norefferer"),
+                            klass="badge badge-pill person-link badge-secondary movetext",
+                            href=join_urls(
+                                "https://vimeo.com",
+                                o_link,
+                            ),
+                        ):
+                            with tag("span", klass="moveup"):
+                                text("vimeo")
+                    elif other_link == "youtube":
+                        with tag(
+                            "a",
+                            ("target", "_blank"),
+                            ("rel", "norefferer"),
+                            klass="badge badge-pill person-link badge-secondary movetext",
+                            href=join_urls(
+                                "https://www.youtube.com",
+                                "user",
+                                o_link,
+                            ),
+                        ):
+                            with tag("span", klass="moveup"):
+                                text("youtube")
+                    else:
+                        print(
+                            f"Unknown tag: {other_link}",
+                            file=sys.stderr,
+                        )
+    return str(doc.getvalue())
 
 
-def create_people_page(sources: List[Person]) -> str:
+def people_skeleton() -> str:
+    """Creates the people page, with a placeholder where the cards go"""
     doc, tag, text = Doc().tagtext()
     doc.asis("<!DOCTYPE html>")
     with tag("html", ("lang", "en")):
@@ -82,98 +201,7 @@ def create_people_page(sources: List[Person]) -> str:
             doc.asis("<!-- list -->")
             with tag("main", klass="container"):
                 with tag("div", klass="card-columns"):
-                    for c in sources:
-                        with tag("div", klass="card"):
-                            with tag(
-                                "div",
-                                ("class", "image-container"),
-                                (
-                                    "style",
-                                    (
-                                        f"padding-bottom:{get_ratio_image_from_relative_path(c.image)};"
-                                    ),
-                                ),
-                            ):
-                                doc.stag(
-                                    "img",
-                                    ("class", "card-img-top img-fluid"),
-                                    ("src", image_path(c.image)),
-                                    alt=c.name,
-                                )
-                            with tag("div", klass="card-block"):
-                                with tag("h4", klass="card-title"):
-                                    text(c.name)
-                                with tag("div", klass="card-text"):
-                                    for other_link in sorted(
-                                        list(
-                                            {
-                                                k: getattr(c, k)
-                                                for k, v in c.dict().items()
-                                                if k not in ["name", "image"]
-                                                and v is not None
-                                            }
-                                        )
-                                    ):
-                                        o_link = getattr(c, other_link)
-                                        assert o_link is not None, (
-                                            str(c) + f"using {other_link}"
-                                        )
-                                        if other_link == "mal":
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                klass="badge badge-pill person-link badge-secondary",
-                                                href=join_urls(
-                                                    "https://myanimelist.net",
-                                                    "people",
-                                                    o_link,
-                                                ),
-                                            ):
-                                                with tag("span", klass="moveup"):
-                                                    text("mal")
-                                        elif other_link == "website":
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                klass="badge badge-pill person-link badge-secondary movetext",
-                                                href=o_link,
-                                            ):
-                                                with tag("span", klass="moveup"):
-                                                    text("website")
-                                        elif other_link == "vimeo":
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                klass="badge badge-pill person-link badge-secondary movetext",
-                                                href=join_urls(
-                                                    "https://vimeo.com",
-                                                    o_link,
-                                                ),
-                                            ):
-                                                with tag("span", klass="moveup"):
-                                                    text("vimeo")
-                                        elif other_link == "youtube":
-                                            with tag(
-                                                "a",
-                                                ("target", "_blank"),
-                                                ("rel", "norefferer"),
-                                                klass="badge badge-pill person-link badge-secondary movetext",
-                                                href=join_urls(
-                                                    "https://www.youtube.com",
-                                                    "user",
-                                                    o_link,
-                                                ),
-                                            ):
-                                                with tag("span", klass="moveup"):
-                                                    text("youtube")
-                                        else:
-                                            print(
-                                                f"Unknown tag: {other_link}",
-                                                file=sys.stderr,
-                                            )
+                    doc.asis(html_writer.FRAGMENTS)
             doc.asis("<!-- footer -->")
             with tag("footer", ("class", "bg-dark footer")):
                 with tag("a", href=constants.user_link):
@@ -194,18 +222,60 @@ def create_people_page(sources: List[Person]) -> str:
 document.addEventListener('DOMContentLoaded', function() {}, false);
 """
                 )
-    return str(indent(doc.getvalue(), indent_text=True))
+    return str(doc.getvalue())
 
 
-def main() -> None:
+def write_people_page(
+    out: TextIO,
+    sources: List[Person],
+    create_card: Callable[[Person], str] = create_person_card,
+    pretty: bool = True,
+) -> None:
+    """Writes the people page to out, card by card"""
+    cards = (create_card(c) for c in sources)
+    html_writer.write_page(
+        out,
+        people_skeleton(),
+        (html_writer.indent_fragment(c, CARD_LEVEL) for c in cards)
+        if pretty
+        else cards,
+        CARD_LEVEL if pretty else None,
+    )
+
+
+def update_image_index(sources: List[Person]) -> ImageIndex:
+    """Reads any changed images into the image index, and saves it"""
+    index = image_index()
+    for filename in sorted({p.image for p in sources}):
+        index.get(filename)
+    if index.refreshed:
+        print(f"Read {index.refreshed} changed images into the image index")
+    index.write()
+    return index
+
+
+def create_people_page(
+    sources: List[Person],
+    create_card: Callable[[Person], str] = create_person_card,
+    pretty: bool = True,
+) -> str:
+    buf = io.StringIO()
+    write_people_page(buf, sources, create_card, pretty)
+    return buf.getvalue()
+
+
+def load_people(strict: bool = False) -> List[Person]:
     # Read in YAML Sources
-    with open(constants.PEOPLE_SOURCES) as yaml_src:
-        raw_sources = yaml.load(yaml_src, Loader=yaml.FullLoader)
-    sources = [Person.parse_obj(p) for p in raw_sources]
+    return load_models(constants.PEOPLE_SOURCES, Person, strict=strict)
+
+
+def main() -> None:
+    sources = load_people()
+    update_image_index(sources)
     # write out html file
     with open(f"{constants.OUTPUT_DIR}/people.html", "w") as write_html_file:
         print("Generated people.html")
-        write_html_file.write(str(create_people_page(sources)))
+        write_people_page(write_html_file, sources)
 
 
 if __name__ == "__main__":
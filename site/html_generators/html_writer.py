@@ -0,0 +1,125 @@
+import re
+from typing import Iterable, Iterator, Optional, TextIO
+
+from yattag import indent  # type: ignore[import]
+
+# writes pages out piece by piece, instead of building the whole document
+# and running yattag.indent over all of it. The page 'skeleton' has a
+# placeholder where the repeated fragments (rows/cards) go; the skeleton
+# and each fragment are indented separately, which gives the same output as
+# indenting the entire page at once
+
+INDENTATION = "  "
+FRAGMENTS = "<!-- fragments -->"
+
+# elements whose contents are left alone when minifying
+RAW_ELEMENT = re.compile(r"<(pre|script|style|textarea)\b.*?</\1\s*>", re.S | re.I)
+TAG = re.compile(r"(<!--.*?-->|<[^>]*>)", re.S)
+TAG_NAME = re.compile(r"</?([a-zA-Z0-9]+)")
+# comments, except conditional comments
+COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+WHITESPACE = re.compile(r"\s+")
+# whitespace next to these doesn't affect the layout, so it's removed when
+# minifying. Whitespace between inline content is collapsed to one space
+BLOCK_ELEMENTS = frozenset(
+    """
+    html head body title meta link base script style noscript template
+    div p h1 h2 h3 h4 h5 h6 ul ol li dl dt dd nav header footer main section
+    article aside figure figcaption blockquote pre hr br form fieldset
+    table thead tbody tfoot tr th td caption
+    """.split()
+)
+
+# wraps fragments so yattag indents them at the right depth
+_WRAPPER_OPEN = "<x-fragment>"
+_WRAPPER_CLOSE = "</x-fragment>"
+
+
+def indent_fragment(fragment: str, level: int) -> str:
+    """
+    Indents a fragment as if it was nested 'level' tags deep in a document.
+    Includes the leading newline that would separate it from the previous tag
+    """
+    wrapped = _WRAPPER_OPEN * level + fragment + _WRAPPER_CLOSE * level
+    indented = str(indent(wrapped, indentation=INDENTATION, indent_text=True))
+    head = sum(len(INDENTATION * i + _WRAPPER_OPEN + "\n") for i in range(level))
+    tail = sum(len("\n" + INDENTATION * i + _WRAPPER_CLOSE) for i in range(level))
+    return "\n" + indented[head : len(indented) - tail]
+
+
+def fragment_level(skeleton: str) -> int:
+    """How deeply nested the placeholder is in the (indented) skeleton"""
+    i = skeleton.index(FRAGMENTS)
+    line = skeleton[skeleton.rindex("\n", 0, i) + 1 : i]
+    return len(line) // len(INDENTATION)
+
+
+def write_page(
+    out: TextIO,
+    skeleton: str,
+    fragments: Iterable[str],
+    level: Optional[int] = None,
+) -> None:
+    """
+    Writes skeleton to out, with fragments in place of the placeholder
+
+    If level is given, the page is pretty printed. The fragments must
+    already be indented at that level, see indent_fragment
+    """
+    it: Iterator[str] = iter(fragments)
+    first = next(it, None)
+    if first is None:
+        # nothing to write in the placeholder, so the tag
+        # around it may end up on one line
+        page = skeleton.replace(FRAGMENTS, "", 1)
+        out.write(page if level is None else str(indent(page, indent_text=True)))
+        return
+    if level is None:
+        head, tail = skeleton.split(FRAGMENTS, 1)
+    else:
+        skeleton = str(indent(skeleton, indentation=INDENTATION, indent_text=True))
+        assert fragment_level(skeleton) == level, "fragments indented at wrong level"
+        head, tail = skeleton.split(FRAGMENTS, 1)
+        # the placeholder is on its own line
+        head = head[: head.rindex("\n")]
+    out.write(head)
+    out.write(first)
+    for fragment in it:
+        out.write(fragment)
+    out.write(tail)
+
+
+def _is_block(tag: Optional[str]) -> bool:
+    """Whether whitespace next to tag can be removed; None is the start/end of the markup"""
+    if tag is None or tag.startswith("<!"):
+        return True
+    m = TAG_NAME.match(tag)
+    return m is None or m.group(1).lower() in BLOCK_ELEMENTS
+
+
+def _minify_markup(markup: str) -> str:
+    parts = TAG.split(COMMENT.sub("", markup))
+    for i in range(0, len(parts), 2):
+        text = WHITESPACE.sub(" ", parts[i])
+        if _is_block(parts[i - 1] if i > 0 else None):
+            text = text.lstrip(" ")
+        if _is_block(parts[i + 1] if i + 1 < len(parts) else None):
+            text = text.rstrip(" ")
+        parts[i] = text
+    return "".join(parts)
+
+
+def minify(html: str) -> str:
+    """
+    Removes comments and whitespace next to block level tags, and collapses
+    other runs of whitespace to a single space, except inside
+    pre/script/style/textarea elements
+    """
+    out = []
+    pos = 0
+    for m in RAW_ELEMENT.finditer(html):
+        out.append(_minify_markup(html[pos : m.start()]))
+        out.append(m.group(0))
+        pos = m.end()
+    out.append(_minify_markup(html[pos:]))
+    return "".join(out)
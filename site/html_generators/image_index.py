@@ -0,0 +1,96 @@
+import os
+import json
+from pathlib import Path
+from hashlib import sha256
+from typing import Any, Dict, NamedTuple
+
+from PIL import Image  # type: ignore[import]
+
+from . import constants
+
+# dimensions, size and a hash of each image on the people page, so the
+# page can be rendered without opening every image. Entries are keyed by
+# filename, and only read again when the files mtime or size changes
+
+
+class ImageInfo(NamedTuple):
+    width: int
+    height: int
+    # bytes
+    size: int
+    sha256: str
+
+    @property
+    def ratio(self) -> str:
+        """height/width, as a percentage for padding-bottom"""
+        return "{}%".format(self.height / self.width * 100)
+
+
+class ImageIndex:
+    """Persistent index of image metadata
+    args:
+        directory: directory the images are in
+        jsonpath: file the index is persisted to
+    """
+
+    def __init__(
+        self,
+        directory: str = constants.PEOPLE_IMAGES,
+        jsonpath: str = constants.IMAGE_INDEX,
+    ):
+        self.directory = Path(directory)
+        self.jsonpath = Path(jsonpath)
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.refreshed = 0
+        self.changed = False
+        if self.jsonpath.exists():
+            try:
+                self.items = json.loads(self.jsonpath.read_text())
+            except json.JSONDecodeError:  # file is broken, start over
+                self.changed = True
+
+    def _read(self, p: Path, st: os.stat_result) -> Dict[str, Any]:
+        # opening an image only parses its header, the pixels aren't decoded
+        with Image.open(p) as img:
+            width, height = img.size
+        return {
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "width": width,
+            "height": height,
+            "sha256": sha256(p.read_bytes()).hexdigest(),
+        }
+
+    def get(self, filename: str) -> ImageInfo:
+        p = self.directory / filename
+        assert p.exists(), str(p)
+        st = p.stat()
+        entry = self.items.get(filename)
+        if (
+            entry is None
+            or entry["mtime_ns"] != st.st_mtime_ns
+            or entry["size"] != st.st_size
+        ):
+            entry = self.items[filename] = self._read(p, st)
+            self.refreshed += 1
+            self.changed = True
+        return ImageInfo(
+            entry["width"], entry["height"], entry["size"], entry["sha256"]
+        )
+
+    def prune(self) -> None:
+        """Drop entries for images which no longer exist"""
+        for filename in [f for f in self.items if not (self.directory / f).exists()]:
+            del self.items[filename]
+            self.changed = True
+
+    def write(self) -> None:
+        self.prune()
+        if not self.changed and self.jsonpath.exists():
+            return
+        self.jsonpath.parent.mkdir(parents=True, exist_ok=True)
+        # a temp file per process, so concurrent writers can't replace each others
+        tmp = self.jsonpath.with_name(f"{self.jsonpath.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.items, indent=4, sort_keys=True))
+        os.replace(tmp, self.jsonpath)
+        self.changed = False
@@ -0,0 +1,115 @@
+import os
+import json
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image  # type: ignore[import]
+
+from . import constants
+from .image_index import ImageIndex
+
+# smaller copies of the people images, as WebP and in the images original
+# format, so phones don't download the full size images. The people page
+# lists these in srcset; see generate_people_list.image_srcsets
+
+VARIANTS_DIR = os.path.join(constants.OUTPUT_DIR, "resized", "people")
+VARIANTS_URL = "./resized/people"
+# which images have been resized, by their sha256
+VARIANTS_MANIFEST = os.path.join(constants.CACHE_DIR, "image_variants.json")
+
+# the cards are 230-270px wide, except on phones where they're full width
+WIDTHS = (240, 360, 480)
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+def variant_widths(width: int) -> List[int]:
+    """The widths an image is resized to; images are never enlarged"""
+    return [w for w in WIDTHS if w < width]
+
+
+def variant_name(filename: str, width: int, ext: Optional[str] = None) -> str:
+    stem, original_ext = os.path.splitext(filename)
+    return f"{stem}-{width}{ext or original_ext}"
+
+
+def expected_variants(filename: str, width: int) -> List[str]:
+    """Every file made from an image; WebP at each width and the original width, the original format at each width"""
+    names = [variant_name(filename, w, ".webp") for w in variant_widths(width)]
+    names.append(variant_name(filename, width, ".webp"))
+    names.extend(variant_name(filename, w) for w in variant_widths(width))
+    return names
+
+
+def _save(img: Image.Image, dest: str) -> None:
+    if dest.endswith(".webp"):
+        has_alpha = "A" in img.mode or "transparency" in img.info
+        img.convert("RGBA" if has_alpha else "RGB").save(
+            dest, "WEBP", quality=WEBP_QUALITY, method=6
+        )
+    elif img.format == "JPEG" or dest.lower().endswith((".jpg", ".jpeg")):
+        img.save(dest, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        img.save(dest, optimize=True)
+
+
+def resize(src: str, filename: str, dest_dir: str) -> str:
+    """Writes every variant of one image, runs in a worker process"""
+    with Image.open(src) as img:
+        img.load()
+        width, height = img.size
+        _save(img, os.path.join(dest_dir, variant_name(filename, width, ".webp")))
+        for w in variant_widths(width):
+            resized = img.resize(
+                (w, round(height * w / width)), Image.Resampling.LANCZOS
+            )
+            resized.format = img.format
+            _save(resized, os.path.join(dest_dir, variant_name(filename, w, ".webp")))
+            _save(resized, os.path.join(dest_dir, variant_name(filename, w)))
+    return filename
+
+
+def build_variants(
+    images: List[str],
+    index: ImageIndex,
+    dest_dir: str = VARIANTS_DIR,
+    manifest_path: str = VARIANTS_MANIFEST,
+    jobs: int = 0,
+) -> Tuple[int, int]:
+    """
+    Resizes each image in images (filenames in the index directory) whose
+    content changed since it was last resized, and removes variants of
+    images which are no longer used. Returns (resized, skipped)
+    """
+    Path(dest_dir).mkdir(parents=True, exist_ok=True)
+    manifest: Dict[str, str] = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    existing = set(os.listdir(dest_dir))
+    wanted = set()
+    todo = []
+    for filename in images:
+        info = index.get(filename)
+        names = expected_variants(filename, info.width)
+        wanted.update(names)
+        if manifest.get(filename) != info.sha256 or not existing.issuperset(names):
+            todo.append(filename)
+            manifest[filename] = info.sha256
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            for _ in pool.map(
+                resize,
+                [str(index.directory / f) for f in todo],
+                todo,
+                [dest_dir] * len(todo),
+            ):
+                pass
+    for name in existing - wanted:
+        os.remove(os.path.join(dest_dir, name))
+    manifest = {k: v for k, v in manifest.items() if k in images}
+    Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    return len(todo), len(images) - len(todo)
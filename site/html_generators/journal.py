@@ -0,0 +1,139 @@
+import os
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, TextIO, Union
+
+
+def journal_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".journal")
+
+
+class JournalStore:
+    """A JSON object persisted as a snapshot plus an append-only journal
+
+    Setting an entry appends a [key, value] line to the journal, instead of
+    rewriting the whole file. Once the journal is long enough, it's merged
+    into the snapshot, which is replaced atomically, so a crash at any point
+    leaves the last complete snapshot and journal on disk.
+    args:
+        path: the JSON snapshot; the journal is path + '.journal'
+        sort_keys: sort the keys when writing the snapshot
+        sync_every: fsync the journal after this many entries
+        compact_after: merge the journal into the snapshot after this many entries
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        sort_keys: bool = False,
+        sync_every: int = 16,
+        compact_after: int = 64,
+    ):
+        self.path = Path(path)
+        self.journal_path = journal_path(path)
+        self.sort_keys = sort_keys
+        self.sync_every = sync_every
+        self.compact_after = compact_after
+        self.lock = threading.RLock()
+        self.data: Dict[str, Any] = {}
+        self.journal: Optional[TextIO] = None
+        self.unsynced = 0
+        self.journaled = 0
+        self.load()
+        if self.journaled >= self.compact_after:
+            self.compact()
+
+    def load(self) -> None:
+        if self.path.exists():
+            try:
+                self.data = json.loads(self.path.read_text() or "{}")
+            except json.JSONDecodeError:  # broken, start over
+                print(f"[JournalStore] Couldn't parse {self.path}, ignoring it")
+        if self.journal_path.exists():
+            with self.journal_path.open() as f:
+                for line in f:
+                    try:
+                        key, value = json.loads(line)
+                    except ValueError:  # a partially written entry
+                        continue
+                    self.data[key] = value
+                    self.journaled += 1
+
+    def _open_journal(self) -> TextIO:
+        if self.journal is None:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            self.journal = self.journal_path.open("a+")
+            # start on a new line if the last write was cut off
+            if self.journal.tell() > 0:
+                self.journal.seek(self.journal.tell() - 1)
+                if self.journal.read(1) != "\n":
+                    self.journal.write("\n")
+        return self.journal
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.data[key] = value
+            self._open_journal().write(json.dumps([key, value]) + "\n")
+            self.unsynced += 1
+            self.journaled += 1
+            if self.journaled >= self.compact_after:
+                self.compact()
+            elif self.unsynced >= self.sync_every:
+                self.sync()
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def sync(self) -> None:
+        """Makes sure every entry set so far is on disk"""
+        with self.lock:
+            if self.journal is not None and self.unsynced:
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+            self.unsynced = 0
+
+    def compact(self) -> None:
+        """Writes every entry to the snapshot, and empties the journal"""
+        with self.lock:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.parent.mkdir(parents=True, exist_ok=True)
+            with tmp.open("w") as f:
+                json.dump(self.data, f, indent=4, sort_keys=self.sort_keys)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            # if this crashes before the journal is removed, replaying it
+            # over the new snapshot just sets the same entries again
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            self.journal_path.unlink(missing_ok=True)
+            self.unsynced = 0
+            self.journaled = 0
+
+    def merge_journal(self) -> None:
+        """Compacts the store, if anything was journaled since the last compaction"""
+        with self.lock:
+            if self.journaled or self.journal_path.exists():
+                self.compact()
+
+    def close(self) -> None:
+        with self.lock:
+            self.sync()
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
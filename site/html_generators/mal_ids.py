@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import requests
+
+from . import constants, ratelimit
+from .freshness import DAY
+
+# checks the MAL ids in list_sources.yaml against mal-id-cache, a list of
+# every id on MAL. A copy of the list is kept locally, and only downloaded
+# again (with a conditional request) once it's a day old
+
+# list of all current mal ids maintained by me
+ANIME_IDS = "https://raw.githubusercontent.com/seanbreckenridge/mal-id-cache/master/cache/anime_cache.json"
+MAL_ID_CACHE = os.path.join(constants.CACHE_DIR, "mal_id_cache.json")
+
+
+def _read(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            data: Dict[str, Any] = json.load(f)
+        return data
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path: str, data: Dict[str, Any]) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def load_ids(
+    max_age: float = DAY, url: str = ANIME_IDS, path: str = MAL_ID_CACHE
+) -> Set[int]:
+    """
+    Every sfw anime id on MAL (nsfw entries don't belong on the list, so
+    they don't count as valid). Uses the local copy, unless its older than
+    max_age, in which case it's revalidated with the server
+    """
+    saved = _read(path)
+    # copies saved before this only kept sfw ids also had the nsfw ones
+    if saved is not None and not saved.get("sfw_only"):
+        saved = None
+    if saved is not None and time.time() - saved["fetched"] < max_age:
+        return set(saved["ids"])
+    headers = {}
+    if saved is not None:
+        if saved.get("etag"):
+            headers["If-None-Match"] = saved["etag"]
+        if saved.get("modified"):
+            headers["If-Modified-Since"] = saved["modified"]
+    limiter = ratelimit.bucket(url)
+    try:
+        limiter.acquire()
+        resp = requests.get(url, headers=headers, timeout=30)
+        limiter.observe(resp.status_code, resp.headers)
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        if saved is None:
+            raise
+        print(f"Couldn't refresh the MAL id list, using the saved copy: {e}")
+        return set(saved["ids"])
+    if resp.status_code == 304 and saved is not None:
+        saved["fetched"] = time.time()
+        _write(path, saved)
+        return set(saved["ids"])
+    body = resp.json()
+    ids = sorted(set(body["sfw"]))
+    _write(
+        path,
+        {
+            "fetched": time.time(),
+            "sfw_only": True,
+            "etag": resp.headers.get("ETag"),
+            "modified": resp.headers.get("Last-Modified"),
+            "ids": ids,
+        },
+    )
+    return set(ids)
+
+
+def referenced_ids(sources: Iterable[Any]) -> Dict[int, List[str]]:
+    """The MAL ids each source links to, and the names of the sources"""
+    ids: Dict[int, List[str]] = {}
+    for s in sources:
+        for db in s.database or []:
+            if "mal" in db:
+                mal = db["mal"]
+                for mal_id in mal if isinstance(mal, list) else [mal]:
+                    ids.setdefault(int(mal_id), []).append(str(s.name))
+    return ids
+
+
+def invalid_ids(sources: Iterable[Any], ids: Set[int]) -> Dict[int, List[str]]:
+    return {k: v for k, v in referenced_ids(sources).items() if k not in ids}
+
+
+def main() -> None:
+    from .generate_list import load_sources
+
+    parser = argparse.ArgumentParser(
+        description="check the MAL ids in list_sources.yaml are still on MAL"
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=1,
+        help="days before the id list is downloaded again (default: %(default)s)",
+    )
+    args = parser.parse_args()
+    start = time.perf_counter()
+    invalid = invalid_ids(load_sources(), load_ids(args.max_age * DAY))
+    for mal_id, names in sorted(invalid.items()):
+        print(f"{mal_id} ({', '.join(names)}) is not on MAL")
+    print(f"Checked MAL ids in {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
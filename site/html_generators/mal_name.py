@@ -1,85 +1,201 @@
-import json
 import time
-from os import path
+import random
+import threading
 from pathlib import Path
-from typing import Dict, Iterator, Optional, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Set, Any
 
 import requests
 import jikanpy
 
-from . import constants
+from . import constants, ratelimit
+from .journal import JournalStore
+from .freshness import DAY, Freshness, meta_path
+
+
+def retryable(e: Exception) -> bool:
+    """Whether a failed request is worth trying again"""
+    if isinstance(e, jikanpy.APIException):
+        return e.status_code == 429 or e.status_code >= 500
+    return isinstance(e, requests.exceptions.RequestException)
 
 
 class Crawl:
-    """Keep track of time between scrape requests.
+    """Makes requests to Jikan, within its rate limit. Can be shared between threads
     args:
-        wait: time between requests
+        wait: time to back off after the first failed request, doubled each retry
         retry_max: number of times to retry
+        requests_per_second: override the rate limit in ratelimit.HOST_LIMITS
+        base: the Jikan API to use
     """
 
-    def __init__(self, wait: int = 5, retry_max: int = 3):
+    def __init__(
+        self,
+        wait: float = 5,
+        retry_max: int = 3,
+        requests_per_second: Optional[float] = None,
+        base: str = constants.JIKAN_URL,
+    ):
         self.wait = wait
-        self.jikan = jikanpy.Jikan()
         self.retry_max = retry_max
-        self.last_scrape = time.time() - (self.wait * 0.5)
-        # can let user scrape faster the first time.
-
-    def since_scrape(self) -> float:
-        return (time.time() - self.last_scrape) > self.wait
+        self.base = base
+        # requests sessions aren't thread safe, each thread gets its own client
+        self.local = threading.local()
+        self.limiter = (
+            ratelimit.bucket(base)
+            if requests_per_second is None
+            else ratelimit.TokenBucket(requests_per_second)
+        )
+
+    @property
+    def jikan(self) -> jikanpy.Jikan:
+        if not hasattr(self.local, "jikan"):
+            self.local.jikan = jikanpy.Jikan(self.base)
+        jikan: jikanpy.Jikan = self.local.jikan
+        return jikan
 
     def wait_till(self) -> None:
-        while not self.since_scrape():
-            time.sleep(1)
-
-    def get_anime(self, mal_id: int) -> Dict[str, Any]:
-        count = 0
-        while count < self.retry_max:
-            # sleep for successively longer times
-            time.sleep(self.wait * count)
+        """Sleeps until the next request may be made"""
+        self.limiter.acquire()
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff, with jitter so threads don't retry in lockstep"""
+        return random.uniform(0.5, 1.0) * self.wait * 2.0**attempt
+
+    def _anime(
+        self, mal_id: int, headers: Optional[Dict[str, str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        jikan.anime, but the limiter sees the response headers (e.g.
+        Retry-After on a 429), and returns None if the response is 304
+        """
+        url = f"{self.jikan.base}/anime/{mal_id}"
+        response = self.jikan.session.get(url, headers=headers)
+        self.limiter.observe(response.status_code, response.headers)
+        if response.status_code == 304:
+            return None
+        # let jikanpy parse the response/raise errors, same as jikan.anime
+        return self.jikan._wrap_response(response, url, id=mal_id, endpoint="anime")
+
+    def get_anime(
+        self, mal_id: int, headers: Optional[Dict[str, str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Requests the MAL entry. If headers (If-None-Match/If-Modified-Since)
+        are given, returns None if it hasn't changed since
+        """
+        for attempt in range(self.retry_max):
+            if attempt > 0:
+                # sleep for successively longer times
+                time.sleep(self.backoff(attempt - 1))
             try:
                 self.wait_till()
-                response = self.jikan.anime(mal_id)
-                self.last_scrape = time.time()
-                return response
-            except requests.exceptions.RequestException:
-                pass
-            count += 1
+                return self._anime(mal_id, headers)
+            except (requests.exceptions.RequestException, jikanpy.APIException) as e:
+                if not retryable(e):
+                    raise
         raise NotImplementedError(f"Couldn't cache {mal_id}")
 
 
 class Cache:
-    """class to manage caching API requests for MAL names"""
+    """class to manage caching API requests for MAL names
+    args:
+        crawler: the Crawl to download names with
+        concurrency: how many names fetch_many downloads at once
+        jsonpath: file the names are kept in
+        metapath: file when each name was downloaded is kept in
+    """
 
-    def __init__(self, crawler: Optional[Crawl] = None):
-        self.jsonpath = Path(constants.this_dir).parent / "mal_name_cache.json"
-        self.write_to_cache_const = 5
-        self.write_to_cache_periodically = self.write_to_cache_const
+    def __init__(
+        self,
+        crawler: Optional[Crawl] = None,
+        concurrency: int = 3,
+        jsonpath: str = constants.MAL_NAME_CACHE,
+        metapath: Optional[str] = None,
+    ):
+        self.jsonpath = Path(jsonpath)
         self.crawler = crawler or Crawl()
-        self.items: Dict[str, str] = {}
-        if not path.exists(self.jsonpath):
-            open(self.jsonpath, "a").close()
-        with open(self.jsonpath, "r") as js_f:
-            try:
-                self.items = json.load(js_f)
-            except json.JSONDecodeError:  # file is empty or broken
-                pass
-        self.update_json_file()
+        self.concurrency = concurrency
+        self.store = JournalStore(self.jsonpath)
+        self.items: Dict[str, str] = self.store.data
+        # titles rarely change, refresh a few old ones each build
+        self.freshness = Freshness(
+            metapath or meta_path(jsonpath), ttl=180 * DAY, negative_ttl=0, budget=10
+        )
+        self.freshness.adopt(self.items)
 
     def update_json_file(self) -> None:
-        with open(self.jsonpath, "w") as f:
-            json.dump(self.items, f, indent=4)
-
-    def _mal_crawl_name(self, mal_id: int) -> str:
-        """Downloads the name of the MAL id"""
+        """Makes sure every downloaded name is saved"""
+        self.store.sync()
+        self.freshness.sync()
+
+    def _mal_crawl_name(self, mal_id: int) -> Optional[str]:
+        """
+        Downloads the name of the MAL id. If its already cached, this is a
+        conditional request, returning None if it hasn't changed
+        """
+        key = str(mal_id)
         print(f"[Cache][Crawler] Downloading name for MAL ID {mal_id}")
-        return str(self.crawler.get_anime(mal_id)["title"])
+        headers = self.freshness.validators(key) if key in self.items else None
+        response = self.crawler.get_anime(mal_id, headers)
+        if response is None:
+            self.freshness.stamp(key)
+            return None
+        self.freshness.stamp(key, response.get("headers", {}))
+        return str(response["title"])
+
+    def _add(self, id: int, name: str) -> None:
+        if self.items.get(str(id)) != name:
+            self.store[str(id)] = name
+
+    def fetch_many(
+        self,
+        ids: Iterable[int],
+        concurrency: Optional[int] = None,
+        refresh: bool = True,
+    ) -> Dict[int, Exception]:
+        """
+        Downloads the names of any of ids which aren't cached yet, 'concurrency'
+        at a time (still limited by the crawlers requests_per_second)
+
+        If refresh is set, also re-downloads the stale names in ids,
+        up to the refresh budget
+
+        Returns the ids which couldn't be downloaded, and why
+        """
+        ids = {int(id) for id in ids}
+        missing = sorted(id for id in ids if id not in self)
+        stale = (
+            [int(k) for k in self.freshness.take(map(str, ids), self.items)]
+            if refresh
+            else []
+        )
+        failed: Dict[int, Exception] = {}
+        if not missing and not stale:
+            return failed
+        workers = min(concurrency or self.concurrency, len(missing) + len(stale))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(self._mal_crawl_name, id): id for id in missing + stale
+            }
+            for fut in as_completed(futures):
+                id = futures[fut]
+                try:
+                    name = fut.result()
+                except Exception as e:
+                    print(f"[Cache][Crawler] Failed to download MAL ID {id}: {e!r}")
+                    if id not in self:
+                        failed[id] = e
+                    continue
+                if name is not None:
+                    self._add(id, name)
+        return failed
 
     def download_name(self, id: int) -> str:
-        self.write_to_cache_periodically -= 1
-        if self.write_to_cache_periodically < 0:
-            self.write_to_cache_periodically = self.write_to_cache_const
-            self.update_json_file()
-        return self._mal_crawl_name(id)
+        failed = self.fetch_many([id], concurrency=1, refresh=False)
+        if id in failed:
+            raise failed[id]
+        return self.items[str(id)]
 
     def __contains__(self, id: int) -> bool:
         """defines the 'in' keyword on cache."""
@@ -90,8 +206,33 @@ class Cache:
             # print("[Cache] Found name for id {} in cache".format(id))
             return self.items[str(id)]
         else:
-            self.items[str(id)] = self.download_name(id)
-            return self.items[str(id)]
+            return self.download_name(id)
 
     def __iter__(self) -> Iterator[str]:
         return self.items.__iter__()
+
+    def names(self) -> "Names":
+        return Names(self.items)
+
+
+class Names:
+    """Read only view of the cached MAL names, used while rendering
+
+    Never makes requests; names which haven't been downloaded (see
+    Cache.fetch_many) are rendered as the id, and kept track of in missing
+    """
+
+    def __init__(self, items: Mapping[str, str]):
+        self.items = dict(items)
+        self.missing: Set[int] = set()
+
+    @classmethod
+    def load(cls, jsonpath: str = constants.MAL_NAME_CACHE) -> "Names":
+        return cls(JournalStore(jsonpath).data)
+
+    def get(self, id: int) -> str:
+        name = self.items.get(str(id))
+        if name is None:
+            self.missing.add(id)
+            return str(id)
+        return name
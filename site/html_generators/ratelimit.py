@@ -0,0 +1,114 @@
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from typing import Dict, Mapping, Optional, Tuple
+
+# rate limits for every host we make requests to. Each host gets a token
+# bucket shared by everything in the process which requests from it, so
+# the name caches and the link checker can't add up to more than its limit
+
+# (requests per second, burst)
+HOST_LIMITS: Dict[str, Tuple[float, int]] = {
+    # 3 requests per second, 60 per minute
+    "api.jikan.moe": (1.0, 3),
+    # 90 requests per minute
+    "graphql.anilist.co": (1.5, 1),
+}
+DEFAULT_LIMIT: Tuple[float, int] = (5.0, 5)
+
+# most the rate is slowed down by repeated 429/5xx responses
+MAX_SLOWDOWN = 16.0
+
+
+def lower_keys(headers: Optional[Mapping[str, str]]) -> Dict[str, str]:
+    """headers with lower case names, since a plain dict isn't case insensitive"""
+    return {k.lower(): v for k, v in (headers or {}).items()}
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, which is seconds or a HTTP date"""
+    value = lower_keys(headers).get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Allows 'rate' requests per second on average, and up to 'burst' at once
+
+    Thread safe. reserve() takes a token without blocking, and returns how
+    long to wait before it may be used, so the same bucket works with
+    time.sleep and asyncio.sleep
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # don't start any requests before this, e.g. from Retry-After
+        self.blocked_until = 0.0
+        # divides the rate, raised when the host says we're going too fast
+        self.slowdown = 1.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            rate = self.rate / self.slowdown
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self) -> None:
+        time.sleep(self.reserve())
+
+    async def acquire_async(self) -> None:
+        await asyncio.sleep(self.reserve())
+
+    def block(self, seconds: float) -> None:
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def observe(self, status: int, headers: Optional[Mapping[str, str]] = None) -> None:
+        """Adapts the rate to a response from the host"""
+        headers = lower_keys(headers)
+        # 501 is a server not supporting the method (e.g. HEAD), not overload
+        if status == 429 or (status >= 500 and status != 501):
+            with self.lock:
+                self.slowdown = min(self.slowdown * 2, MAX_SLOWDOWN)
+            wait = retry_after(headers)
+            if wait is not None:
+                self.block(wait)
+            return
+        with self.lock:
+            # speed back up gradually
+            self.slowdown = max(1.0, self.slowdown * 0.9)
+        if headers.get("x-ratelimit-remaining") == "0":
+            reset = headers.get("x-ratelimit-reset")
+            if reset is not None and reset.isdigit():
+                self.block(int(reset) - time.time())
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket(url: str) -> TokenBucket:
+    """The bucket for the host of url (or url, if its just a host)"""
+    host = urlparse(url).hostname or url
+    with _buckets_lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(*HOST_LIMITS.get(host, DEFAULT_LIMIT))
+        return _buckets[host]
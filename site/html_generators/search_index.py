@@ -0,0 +1,105 @@
+import os
+import re
+import json
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from . import constants
+from .generate_list import IdRegistry, Source, Tag, page_href, row_id
+from .mal_name import Names
+
+# the index the search box on the list pages uses (see static/js/search.js),
+# written to ./search:
+#
+#   entries.json: one column per field, one row per short, in the
+#                 recommendation order
+#   t-<c>.json:   {token: [entry numbers]}, for the tokens starting with c
+#
+# tokens come from the names of the shorts and the names of their MAL
+# entries (e.g. the episodes of an anthology). The script only loads the
+# shards for the words that are typed, once something is typed
+
+SEARCH_DIR = os.path.join(constants.OUTPUT_DIR, "search")
+TOKEN = re.compile(r"[^\W_]+")
+
+
+def normalize(text: str) -> List[str]:
+    """Lowercased words, without accents. search.js does the same"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return TOKEN.findall(stripped.lower())
+
+
+def shard(token: str) -> str:
+    c = token[0]
+    return c if c.isascii() and c.isalnum() else "_"
+
+
+def mal_ids(s: Source) -> List[int]:
+    ids: List[int] = []
+    for db in s.database or []:
+        if "mal" in db:
+            mal = db["mal"]
+            ids.extend(map(int, mal) if isinstance(mal, list) else [int(mal)])
+    return ids
+
+
+def build_index(
+    sources: List[Source], mal_names: Names, pages: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Returns {filename: contents} for each file in the index
+    pages: the name of the page each short is on, if the list is paginated
+    """
+    tags = [t.value for t in Tag]
+    entries: Dict[str, List[Any]] = {
+        k: [] for k in ("href", "name", "tags", "duration", "episodes", "date")
+    }
+    tokens: Dict[str, Set[int]] = {}
+    ids = IdRegistry(sources)
+    for i, s in enumerate(sources):
+        rid = row_id(s, ids)
+        page = page_href((pages or {}).get(rid, "index"))
+        entries["href"].append(f"{page}#{rid}")
+        entries["name"].append(s.name)
+        entries["tags"].append(sorted(tags.index(t.value) for t in s.tags))
+        entries["duration"].append(s.duration)
+        entries["episodes"].append(s.episodes)
+        entries["date"].append(str(s.date))
+        titles = [s.name] + [
+            name for mal_id in mal_ids(s) if (name := mal_names.items.get(str(mal_id)))
+        ]
+        for title in titles:
+            for token in normalize(title):
+                tokens.setdefault(token, set()).add(i)
+    shards: Dict[str, Dict[str, List[int]]] = {}
+    for token in sorted(tokens):
+        shards.setdefault(shard(token), {})[token] = sorted(tokens[token])
+    files: Dict[str, Any] = {
+        "entries.json": {"tag_names": tags, "shards": sorted(shards), **entries}
+    }
+    for c, contents in shards.items():
+        files[f"t-{c}.json"] = contents
+    return files
+
+
+def write_index(files: Dict[str, Any], out_dir: str = SEARCH_DIR) -> Tuple[int, int]:
+    """
+    Writes each file which changed since the last build, and removes files
+    which are no longer part of the index. Returns (written, unchanged)
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for name, contents in files.items():
+        data = json.dumps(contents, separators=(",", ":"), ensure_ascii=False)
+        p = out / name
+        if p.exists() and p.read_text() == data:
+            continue
+        p.write_text(data)
+        written += 1
+    for p in out.glob("*.json"):
+        if p.name not in files:
+            p.unlink()
+    return written, len(files) - written
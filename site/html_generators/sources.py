@@ -0,0 +1,136 @@
+import os
+import json
+import pickle
+import tempfile
+from pathlib import Path
+from hashlib import sha256
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple, Type, TypeVar
+
+import yaml
+import pydantic
+from pydantic import BaseModel
+
+from . import constants
+
+# use the libyaml bindings if pyyaml was built with them, the pure python
+# loader is about 10x slower
+try:
+    from yaml import CFullLoader as FullLoader
+except ImportError:
+    from yaml import FullLoader  # type: ignore[assignment]
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def parse_yaml(data: bytes, loader: Any = FullLoader) -> Any:
+    return yaml.load(data, Loader=loader)
+
+
+def read_yaml(path: str, loader: Any = FullLoader) -> Any:
+    return parse_yaml(Path(path).read_bytes(), loader)
+
+
+def snapshot_path(path: str) -> Path:
+    return Path(constants.CACHE_DIR) / f"{Path(path).stem}.pickle"
+
+
+def fingerprint(raw: Any) -> str:
+    """Hash of an entry as it was read from the YAML file"""
+    return sha256(json.dumps(raw, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def schema_digest(model: Type[BaseModel]) -> str:
+    return sha256(model.schema_json().encode() + pydantic.VERSION.encode()).hexdigest()
+
+
+class Snapshot(NamedTuple):
+    file_digest: str
+    schema_digest: str
+    fingerprints: List[str]
+    models: List[Any]
+
+
+def validate_models(
+    raw: List[Any],
+    model: Type[M],
+    previous: Optional[Snapshot] = None,
+    strict: bool = False,
+) -> Tuple[List[M], List[str]]:
+    """
+    Validates each entry in raw, returning the models and their fingerprints
+
+    Entries which are identical to one in the previous snapshot reuse the
+    model validated then, only new or edited entries are validated again.
+    strict validates every entry
+    """
+    validated: Dict[str, M] = {}
+    if previous is not None and not strict:
+        if previous.schema_digest == schema_digest(model):
+            validated = dict(zip(previous.fingerprints, previous.models))
+    used: Set[str] = set()
+    models: List[M] = []
+    fingerprints: List[str] = []
+    for entry in raw:
+        fp = fingerprint(entry)
+        m = validated.get(fp)
+        if m is None:
+            m = model.parse_obj(entry)
+        elif fp in used:
+            # duplicate entries shouldn't share a (mutable) model
+            m = m.copy(deep=True)
+        used.add(fp)
+        models.append(m)
+        fingerprints.append(fp)
+    return models, fingerprints
+
+
+def read_snapshot(path: str) -> Optional[Snapshot]:
+    snapshot = snapshot_path(path)
+    if not snapshot.exists():
+        return None
+    try:
+        with snapshot.open("rb") as f:
+            saved = pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+        return None  # broken, rebuild it
+    return saved if isinstance(saved, Snapshot) else None
+
+
+def load_models(
+    path: str, model: Type[M], use_snapshot: bool = True, strict: bool = False
+) -> List[M]:
+    """
+    Reads and validates a YAML list of 'model's
+
+    The validated list is saved to a snapshot keyed on the contents of the
+    file (and the model definition), so if the file hasn't changed since the
+    last time, it's loaded from that instead of being parsed/validated again.
+    If it has changed, only the entries which changed are validated again;
+    strict validates every entry
+    """
+    data = Path(path).read_bytes()
+    file_digest = sha256(data).hexdigest()
+    schema = schema_digest(model)
+    snapshot = snapshot_path(path)
+    previous = read_snapshot(path) if use_snapshot else None
+    if (
+        previous is not None
+        and not strict
+        and previous.file_digest == file_digest
+        and previous.schema_digest == schema
+    ):
+        return list(previous.models)
+    models, fingerprints = validate_models(parse_yaml(data), model, previous, strict)
+    if use_snapshot:
+        snapshot.parent.mkdir(parents=True, exist_ok=True)
+        # a temp file per writer, stages loading the same file can run at once
+        with tempfile.NamedTemporaryFile(
+            dir=snapshot.parent, prefix=snapshot.name, suffix=".tmp", delete=False
+        ) as f:
+            pickle.dump(
+                Snapshot(file_digest, schema, fingerprints, models),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(f.name, snapshot)
+    return models
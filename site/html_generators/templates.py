@@ -0,0 +1,382 @@
+import sys
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from . import constants
+from .mal_name import Names
+from .generate_list import (
+    DATE_BADGE,
+    IdRegistry,
+    Source,
+    anilist_mal_ids,
+    create_row,
+    format_duration,
+    join_urls,
+    row_id,
+    tag_page,
+    tag_slug,
+)
+from .generate_people_list import (
+    IMAGE_SIZES,
+    Person,
+    create_person_card,
+    get_ratio_image_from_relative_path,
+    image_path,
+    image_srcsets,
+)
+
+# string building versions of create_row and create_person_card, which skip
+# the per tag context managers/attribute dicts yattag uses. These have
+# to produce exactly the same markup as the yattag versions; run
+# benchmark.py to compare the two
+
+
+def _text(s: Union[str, int, float]) -> str:
+    """escapes a html text node, like yattag"""
+    if isinstance(s, (int, float)):
+        return str(s)
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _attr(s: Union[str, int, float]) -> str:
+    """escapes a html attribute value, like yattag"""
+    if isinstance(s, (int, float)):
+        return str(s)
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;")
+
+
+_BLANK = 'target="_blank" rel="norefferer"'
+_LIST_ITEM = 'class="list-group-item list-group-item-action"'
+_COLLAPSE = 'role="button" href="{}" aria-expanded="false" data-toggle="collapse"'
+
+
+def _tag_badges(s: Source) -> str:
+    parts: List[str] = []
+    for t in sorted(s.tags, key=lambda t: t.value):
+        title = f"list only shorts tagged '{t.value.lower()}'"
+        href = f"./{tag_page(t, constants.Order.REC)}"
+        parts.append(
+            f'<span class="badge tag {_attr(tag_slug(t))}">'
+            f'<a href="{_attr(href)}" class="badge-link" data-toggle="tooltip" '
+            f'data-original-title="{_attr(title)}">'
+            f"{_text(t.value)}</a></span>"
+        )
+    return "".join(parts)
+
+
+def _icon(src: str, alt: str, klass: str = "rounded-circle", extra: str = "") -> str:
+    return f'<img src="{src}" alt="{_attr(alt)}" class="{klass}"{extra} />'
+
+
+def _cc(title: str) -> str:
+    return (
+        '<span class="badge cc" data-toggle="tooltip" '
+        f'data-original-title="{title}">CC</span>'
+    )
+
+
+def _database_buttons(s: Source, ids: IdRegistry) -> str:
+    parts: List[str] = []
+    for db in s.database or []:
+        if "mal" in db:
+            mal = db["mal"]
+            icon = _icon("./images/mal_icon.png", f"{s.name} (MyAnimeList)")
+            if isinstance(mal, list):
+                href = _attr(ids.list_id(s, mal, octothorpe=True))
+                parts.append(f"<a {_COLLAPSE.format(href)}>{icon}</a>")
+            else:
+                mal_url = join_urls("https://myanimelist.net", "anime", str(mal))
+                parts.append(f'<a href="{_attr(mal_url)}" {_BLANK}>{icon}</a>')
+        elif "anilist" in db:
+            anilist_link = db["anilist"]
+            icon = _icon(
+                "./images/anilist.png",
+                f"{s.name} (AniList)",
+                klass="rounded-circle anilist-circle",
+            )
+            if isinstance(anilist_link, list):
+                href = _attr(ids.list_id(s, anilist_link, octothorpe=True))
+                parts.append(f"<a {_COLLAPSE.format(href)}>{icon}</a>")
+            else:
+                parts.append(f'<a href="{_attr(anilist_link)}" {_BLANK}>{icon}</a>')
+        else:
+            print("Warning, found unknown database:", db)
+    return "".join(parts)
+
+
+def _link(href: str, icon: str) -> str:
+    return f'<a {_BLANK} href="{_attr(href)}">{icon}</a>'
+
+
+def _streaming_buttons(s: Source, ids: IdRegistry) -> str:
+    parts: List[str] = []
+    for vid in s.streaming or []:
+        if "youtube" in vid:
+            yt = vid["youtube"]
+            icon = _icon("./images/yt_icon.png", f"{s.name} (Youtube)")
+            if isinstance(yt, list):
+                href = _attr(ids.list_id(s, yt, octothorpe=True))
+                cc = _cc("Videos have Subtitles") if s.cc else ""
+                parts.append(f"<a {_COLLAPSE.format(href)}>{icon}{cc}</a>")
+            else:
+                base = (
+                    "https://youtu.be"
+                    if "playlist" not in str(yt)
+                    else "https://youtube.com"
+                )
+                cc = _cc("Video has Subtitles") if s.cc else ""
+                parts.append(_link(join_urls(base, str(yt)), icon + cc))
+        elif "vimeo" in vid:
+            vimeo = vid["vimeo"]
+            icon = _icon("./images/vimeo_icon.png", f"{s.name} (Vimeo)")
+            if isinstance(vimeo, list):
+                href = _attr(ids.list_id(s, vimeo, octothorpe=True))
+                parts.append(f"<a {_COLLAPSE.format(href)}>{icon}</a>")
+            else:
+                parts.append(_link(join_urls("https://vimeo.com", str(vimeo)), icon))
+        elif "crunchyroll" in vid:
+            parts.append(
+                _link(
+                    join_urls("http://www.crunchyroll.com", str(vid["crunchyroll"])),
+                    _icon("./images/cr_icon.png", f"{s.name} (Crunchyroll)"),
+                )
+            )
+        elif "netflix" in vid:
+            parts.append(
+                _link(
+                    join_urls("https://www.netflix.com", "title", str(vid["netflix"])),
+                    _icon("./images/netflix_icon.png", f"{s.name} (Netflix)"),
+                )
+            )
+        elif "funimation" in vid:
+            href = join_urls(
+                "https://www.funimation.com", "shows", str(vid["funimation"])
+            )
+            icon = _icon(
+                "./images/fn_icon.png", f"{s.name} (Funimation)", extra=f" {_BLANK}"
+            )
+            parts.append(f'<a href="{_attr(href)}">{icon}</a>')
+        elif "hidive" in vid:
+            parts.append(
+                _link(
+                    join_urls("https://www.hidive.com", "tv", str(vid["hidive"])),
+                    _icon("./images/hidive_icon.png", f"{s.name} (Hidive)"),
+                )
+            )
+        elif "twitter" in vid:
+            parts.append(
+                _link(
+                    join_urls(str(vid["twitter"])),
+                    _icon("./images/twitter.svg", f"{s.name} (Twitter)"),
+                )
+            )
+        elif "website" in vid:
+            parts.append(
+                _link(
+                    str(vid["website"]),
+                    _icon("./images/link.png", "website", extra=f" {_BLANK}"),
+                )
+            )
+        else:
+            print("Warning, unfound 'source' in streaming:", vid)
+    return "".join(parts)
+
+
+def _list_group(list_id: str, items: List[str]) -> str:
+    return (
+        f'<div class="collapse rounded mb-2" id="{_attr(list_id)}">'
+        f'<div class="list-group">{"".join(items)}</div></div>'
+    )
+
+
+def _list_item(href: str, label: Union[str, int]) -> str:
+    return f'<a {_BLANK} {_LIST_ITEM} href="{_attr(href)}">{_text(label)}</a>'
+
+
+def _hidden_rows(
+    s: Source, mal_names: Names, download_names: bool, ids: IdRegistry
+) -> str:
+    parts: List[str] = []
+    if s.extra_info is not None:
+        extra_id = ids.extra_info_id(s, octothorpe=False)
+        parts.append(
+            '<div class="collapse border rounded-bottom border-top-0 mb-1" '
+            f'id="{_attr(extra_id)}"><p class="pl-2 mb-0">'
+            f"{_text(str(s.extra_info))}</p></div>"
+        )
+    for db in s.database or []:
+        mal = db.get("mal")
+        if isinstance(mal, list):
+            parts.append(
+                _list_group(
+                    ids.list_id(s, mal, octothorpe=False),
+                    [
+                        _list_item(
+                            join_urls("https://myanimelist.net", "anime", str(entry)),
+                            mal_names.get(int(entry)) if download_names else entry,
+                        )
+                        for entry in mal
+                    ],
+                )
+            )
+        anilist = db.get("anilist")
+        if isinstance(anilist, list):
+            parts.append(
+                _list_group(
+                    ids.list_id(s, anilist, octothorpe=False),
+                    [
+                        _list_item(
+                            str(url),
+                            mal_names.get(int(entry)) if download_names else entry,
+                        )
+                        for entry, url in zip(anilist_mal_ids(s, db), anilist)
+                    ],
+                )
+            )
+    for vid in s.streaming or []:
+        if "youtube" in vid and isinstance(vid["youtube"], list):
+            videos = vid["youtube"]
+            items: List[str] = []
+            assert s.database is not None
+            for db in s.database:
+                if "mal" in db and isinstance(db["mal"], list):
+                    for mal_id, v in zip(db["mal"], videos):
+                        items.append(
+                            _list_item(
+                                join_urls("https://youtu.be", str(v)),
+                                mal_names.get(int(mal_id)),
+                            )
+                        )
+                elif "anilist" in db and isinstance(db["anilist"], list):
+                    pass  # same entries as the MAL list
+                else:
+                    for i, v in enumerate(videos, 1):
+                        items.append(
+                            _list_item(
+                                join_urls("https://youtu.be", str(v)), f"Episode {i}"
+                            )
+                        )
+            parts.append(_list_group(ids.list_id(s, videos, octothorpe=False), items))
+        elif "vimeo" in vid and isinstance(vid["vimeo"], list):
+            videos = vid["vimeo"]
+            parts.append(
+                _list_group(
+                    ids.list_id(s, videos, octothorpe=False),
+                    [
+                        _list_item(
+                            join_urls("https://vimeo.com", str(v)), f"Episode {i}"
+                        )
+                        for i, v in enumerate(videos, 1)
+                    ],
+                )
+            )
+    return "".join(parts)
+
+
+def _time(s: Source) -> str:
+    if s.duration is not None and s.episodes is not None:
+        dur, eps = s.duration, s.episodes
+        if eps == 1:
+            label = format_duration(dur)
+        elif eps == 0:  # unknown ep count
+            label = f"{format_duration(dur)} x ? eps"
+        else:
+            label = f"{format_duration(dur)} x {eps} eps"
+        return f'<div class="time col-md-1"><span class="badge">{_text(label)}</span></div>'
+    print("Undefined duration/episodes:", s)
+    return ""
+
+
+def compiled_row(
+    s: Source,
+    mal_names: Names,
+    download_names: bool,
+    ids: Optional[IdRegistry] = None,
+) -> str:
+    """Same as generate_list.create_row"""
+    if ids is None:
+        ids = IdRegistry()
+    info = ""
+    if s.extra_info is not None:
+        href = ids.extra_info_id(s, octothorpe=True)
+        info = (
+            '<a role="button" class="more-info-expand ml-2" '
+            f'href="{_attr(href)}" aria-expanded="false" data-toggle="collapse">ⓘ</a>'
+        )
+    return (
+        f'<div class="anime-row-container" id="{_attr(row_id(s, ids))}">'
+        '<div class="row anime-row align-items-center border">'
+        f'<div class="col-sm"><h6>{_text(str(s.name))}{_tag_badges(s)}'
+        f"{DATE_BADGE}{info}</h6></div>"
+        f"{_time(s)}"
+        '<div class="circular-buttons-container col-md-4 col-lg-3 col-xl-3">'
+        f"{_database_buttons(s, ids)}{_streaming_buttons(s, ids)}</div>"
+        "</div>"
+        f"{_hidden_rows(s, mal_names, download_names, ids)}"
+        "</div>"
+    )
+
+
+_PERSON_LINKS: Dict[str, Tuple[str, ...]] = {
+    "mal": (
+        "badge badge-pill person-link badge-secondary",
+        "https://myanimelist.net",
+        "people",
+    ),
+    "website": ("badge badge-pill person-link badge-secondary movetext",),
+    "vimeo": (
+        "badge badge-pill person-link badge-secondary movetext",
+        "https://vimeo.com",
+    ),
+    "youtube": (
+        "badge badge-pill person-link badge-secondary movetext",
+        "https://www.youtube.com",
+        "user",
+    ),
+}
+
+
+def compiled_person_card(c: Person) -> str:
+    """Same as generate_people_list.create_person_card"""
+    links: List[str] = []
+    for other_link in sorted(
+        k for k, v in c.dict().items() if k not in ["name", "image"] and v is not None
+    ):
+        o_link = getattr(c, other_link)
+        assert o_link is not None, str(c) + f"using {other_link}"
+        if other_link not in _PERSON_LINKS:
+            print(f"Unknown tag: {other_link}", file=sys.stderr)
+            continue
+        klass, *base = _PERSON_LINKS[other_link]
+        href = join_urls(*base, o_link) if base else o_link
+        links.append(
+            f'<a {_BLANK} class="{klass}" href="{_attr(href)}">'
+            f'<span class="moveup">{other_link}</span></a>'
+        )
+    ratio = get_ratio_image_from_relative_path(c.image)
+    webp, original = image_srcsets(c.image)
+    return (
+        '<div class="card">'
+        f'<div class="image-container" style="{_attr(f"padding-bottom:{ratio};")}">'
+        f'<picture><source type="image/webp" srcset="{_attr(webp)}" '
+        f'sizes="{_attr(IMAGE_SIZES)}" />'
+        f'<img class="card-img-top img-fluid" src="{_attr(image_path(c.image))}" '
+        f'srcset="{_attr(original)}" sizes="{_attr(IMAGE_SIZES)}" '
+        f'alt="{_attr(c.name)}" /></picture></div>'
+        '<div class="card-block">'
+        f'<h4 class="card-title">{_text(c.name)}</h4>'
+        f'<div class="card-text">{"".join(links)}</div>'
+        "</div></div>"
+    )
+
+
+RowRenderer = Callable[[Source, Names, bool, IdRegistry], str]
+CardRenderer = Callable[[Person], str]
+
+ROW_RENDERERS: Dict[str, RowRenderer] = {
+    "yattag": create_row,
+    "compiled": compiled_row,
+}
+CARD_RENDERERS: Dict[str, CardRenderer] = {
+    "yattag": create_person_card,
+    "compiled": compiled_person_card,
+}
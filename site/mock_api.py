@@ -0,0 +1,310 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from html_generators import ratelimit  # type: ignore[import]
+
+# a local stand in for the Jikan anime endpoint and the AniList GraphQL
+# API, to run the name caches against without touching the real services:
+#
+#   python3 mock_api.py --port 8765 --latency 0.1 --rate-limit-every 20
+#   ANIMESHORTS_JIKAN_URL=http://127.0.0.1:8765/v3 \
+#   ANIMESHORTS_ANILIST_URL=http://127.0.0.1:8765/graphql python3 generate.py -f
+#
+# Unknown ids get made up names/URLs, unless responses were recorded with
+# --record (which forwards requests to the real APIs, within their rate
+# limits in ratelimit.HOST_LIMITS) and are replayed with --replay
+
+JIKAN_URL = "https://api.jikan.moe/v3"
+ANILIST_URL = "https://graphql.anilist.co"
+
+ANIME_PATH = re.compile(r"/v3/anime/(\d+)/?$")
+
+
+class Options:
+    """What the server responds with
+    args:
+        latency: seconds to wait before each response
+        rate_limit_every: respond to every Nth request with a 429
+        retry_after: Retry-After sent with each 429
+        fail_rate: fraction of requests to fail with a 500
+        missing_every: ids divisible by this aren't on AniList
+        seed: seed for fail_rate
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit_every: int = 0,
+        retry_after: float = 1.0,
+        fail_rate: float = 0.0,
+        missing_every: int = 0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.fail_rate = fail_rate
+        self.missing_every = missing_every
+        self.random = random.Random(seed)
+
+
+def forward(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """Makes a request to a real API, within its rate limit"""
+    limiter = ratelimit.bucket(url)
+    limiter.acquire()
+    resp = requests.request(method, url, timeout=30, **kwargs)
+    limiter.observe(resp.status_code, resp.headers)
+    return resp
+
+
+class Fixtures:
+    """Recorded responses, keyed by MAL id"""
+
+    def __init__(self, path: Optional[str] = None, record: bool = False):
+        self.path = path
+        self.record = record
+        self.jikan: Dict[str, Any] = {}
+        self.anilist: Dict[str, Optional[str]] = {}
+        self.lock = threading.Lock()
+        if path is not None and not record:
+            with open(path) as f:
+                data = json.load(f)
+            self.jikan, self.anilist = data["jikan"], data["anilist"]
+
+    def save(self) -> None:
+        if self.path is None or not self.record:
+            return
+        with self.lock, open(self.path, "w") as f:
+            json.dump({"jikan": self.jikan, "anilist": self.anilist}, f, indent=4)
+
+    def anime(self, mal_id: int) -> Tuple[int, Any]:
+        key = str(mal_id)
+        if self.record:
+            resp = forward("GET", f"{JIKAN_URL}/anime/{mal_id}")
+            with self.lock:
+                self.jikan[key] = {"status": resp.status_code, "body": resp.json()}
+        elif self.path is None:
+            return 200, {"mal_id": mal_id, "title": f"Anime {mal_id}"}
+        recorded = self.jikan.get(key)
+        if recorded is None:
+            return 404, {"status": 404, "message": "Resource does not exist"}
+        return recorded["status"], recorded["body"]
+
+    def anilist_urls(self, mal_ids: List[int], missing_every: int) -> Dict[int, str]:
+        if self.record:
+            resp = forward(
+                "POST",
+                ANILIST_URL,
+                json={"query": ANILIST_QUERY, "variables": {"ids": mal_ids}},
+            )
+            found = {
+                m["idMal"]: m["siteUrl"] for m in resp.json()["data"]["Page"]["media"]
+            }
+            with self.lock:
+                for mal_id in mal_ids:
+                    self.anilist[str(mal_id)] = found.get(mal_id)
+        elif self.path is None:
+            return {
+                mal_id: f"https://anilist.co/anime/{mal_id}"
+                for mal_id in mal_ids
+                if not missing_every or mal_id % missing_every
+            }
+        return {
+            mal_id: url
+            for mal_id in mal_ids
+            if (url := self.anilist.get(str(mal_id))) is not None
+        }
+
+
+ANILIST_QUERY = """query($ids: [Int]){Page(perPage: 50){media(idMal_in: $ids, type: ANIME){idMal siteUrl}}}"""
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.jikan = 0
+        self.anilist = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return (
+            f"{self.requests} requests ({self.jikan} Jikan, {self.anilist} AniList), "
+            f"{self.rate_limited} rate limited, {self.failed} failed, "
+            f"{self.not_modified} not modified"
+        )
+
+
+class MockAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        options: Optional[Options] = None,
+        fixtures: Optional[Fixtures] = None,
+    ):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.options = options or Options()
+        self.fixtures = fixtures or Fixtures()
+        self.stats = Stats()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def jikan_url(self) -> str:
+        return f"{self.url}/v3"
+
+    @property
+    def anilist_url(self) -> str:
+        return f"{self.url}/graphql"
+
+    def start(self) -> "MockAPI":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: MockAPI
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def send_json(
+        self, status: int, body: Any, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def injected(self) -> bool:
+        """Waits, then responds with a 429/500 if this request should fail"""
+        opts, stats = self.server.options, self.server.stats
+        with stats.lock:
+            stats.requests += 1
+            count = stats.requests
+            fail = opts.random.random() < opts.fail_rate
+        time.sleep(opts.latency)
+        if opts.rate_limit_every and count % opts.rate_limit_every == 0:
+            with stats.lock:
+                stats.rate_limited += 1
+            self.send_json(
+                429,
+                {"error": "Too Many Requests"},
+                {"Retry-After": str(opts.retry_after)},
+            )
+            return True
+        if fail:
+            with stats.lock:
+                stats.failed += 1
+            self.send_json(500, {"error": "Internal Server Error"})
+            return True
+        return False
+
+    def do_GET(self) -> None:
+        match = ANIME_PATH.match(self.path)
+        if match is None:
+            self.send_json(404, {"error": "Not Found"})
+            return
+        if self.injected():
+            return
+        with self.server.stats.lock:
+            self.server.stats.jikan += 1
+        status, body = self.server.fixtures.anime(int(match.group(1)))
+        etag = '"{}"'.format(sha256(json.dumps(body).encode()).hexdigest()[:16])
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            with self.server.stats.lock:
+                self.server.stats.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_json(status, body, {"ETag": etag} if status == 200 else None)
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") not in ("", "/graphql"):
+            self.send_json(404, {"error": "Not Found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.injected():
+            return
+        with self.server.stats.lock:
+            self.server.stats.anilist += 1
+        variables = request.get("variables", {})
+        if "ids" in variables:  # Page(idMal_in: $ids)
+            found = self.server.fixtures.anilist_urls(
+                variables["ids"], self.server.options.missing_every
+            )
+            media = [{"idMal": k, "siteUrl": v} for k, v in found.items()]
+            self.send_json(200, {"data": {"Page": {"media": media}}})
+        elif "id" in variables:  # Media(idMal: $id)
+            found = self.server.fixtures.anilist_urls(
+                [variables["id"]], self.server.options.missing_every
+            )
+            if variables["id"] not in found:
+                self.send_json(404, {"data": {"Media": None}})
+            else:
+                url = found[variables["id"]]
+                self.send_json(200, {"data": {"Media": {"siteUrl": url}}})
+        else:
+            self.send_json(400, {"errors": [{"message": "Unknown query"}]})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="local stand in for Jikan/AniList")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--rate-limit-every", type=int, default=0, metavar="N")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="0 to 1")
+    parser.add_argument("--missing-every", type=int, default=0, metavar="N")
+    parser.add_argument("--seed", type=int, default=0)
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument("--record", metavar="FILE", help="record real responses")
+    fixtures.add_argument("--replay", metavar="FILE", help="replay recorded responses")
+    args = parser.parse_args()
+    server = MockAPI(
+        args.port,
+        Options(
+            args.latency,
+            args.rate_limit_every,
+            args.retry_after,
+            args.fail_rate,
+            args.missing_every,
+            args.seed,
+        ),
+        Fixtures(args.record or args.replay, record=args.record is not None),
+    )
+    print(f"Jikan:   {server.jikan_url}", file=sys.stderr)
+    print(f"AniList: {server.anilist_url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.fixtures.save()
+        print(server.stats, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
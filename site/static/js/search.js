@@ -0,0 +1,108 @@
+// search box for the list pages. The index (written by
+// html_generators/search_index.py) is only downloaded once something is
+// typed, and only the shards for the words being searched for
+
+(function () {
+  const input = document.getElementById("search");
+  const results = document.getElementById("search-results");
+  if (input === null || results === null) {
+    return;
+  }
+  const MAX_RESULTS = 20;
+  const shards = {};
+  let entriesLoad = null;
+  let entries = null;
+
+  function fetchJSON(name) {
+    return fetch(`./search/${name}`).then((resp) => resp.json());
+  }
+
+  // same as search_index.normalize
+  function normalize(text) {
+    return (
+      text
+        .normalize("NFKD")
+        .replace(/\p{M}/gu, "")
+        .toLowerCase()
+        .match(/[\p{L}\p{N}]+/gu) || []
+    );
+  }
+
+  function shardFor(token) {
+    return /^[a-z0-9]/.test(token) ? token[0] : "_";
+  }
+
+  function loadShard(c) {
+    if (!(c in shards)) {
+      shards[c] = entries.shards.includes(c)
+        ? fetchJSON(`t-${c}.json`)
+        : Promise.resolve({});
+    }
+    return shards[c];
+  }
+
+  // entries with a word starting with token
+  async function matching(token) {
+    const shard = await loadShard(shardFor(token));
+    const found = new Set();
+    for (const [word, ids] of Object.entries(shard)) {
+      if (word.startsWith(token)) {
+        ids.forEach((id) => found.add(id));
+      }
+    }
+    return found;
+  }
+
+  function formatDuration(entry) {
+    const dur = entries.duration[entry];
+    if (dur === null) {
+      return "";
+    }
+    const eps = entries.episodes[entry];
+    const mins = `${Math.round(dur * 10) / 10} min`;
+    return eps > 1 ? `${mins} x ${eps} eps` : mins;
+  }
+
+  function render(ids) {
+    results.replaceChildren();
+    ids.slice(0, MAX_RESULTS).forEach((id) => {
+      const link = document.createElement("a");
+      link.className = "list-group-item list-group-item-action";
+      link.href = entries.href[id];
+      link.textContent = entries.name[id];
+      const info = document.createElement("small");
+      info.className = "ml-2 text-muted";
+      const tags = entries.tags[id].map((t) => entries.tag_names[t]);
+      info.textContent = [tags.join(", "), formatDuration(id), entries.date[id]]
+        .filter((s) => s)
+        .join(" · ");
+      link.appendChild(info);
+      results.appendChild(link);
+    });
+  }
+
+  let latest = 0;
+  async function search() {
+    const query = normalize(input.value);
+    const searchNumber = ++latest;
+    if (query.length === 0) {
+      results.replaceChildren();
+      return;
+    }
+    if (entriesLoad === null) {
+      entriesLoad = fetchJSON("entries.json");
+    }
+    entries = await entriesLoad;
+    const found = await Promise.all(query.map(matching));
+    // a later search finished first
+    if (searchNumber !== latest) {
+      return;
+    }
+    const ids = [...found[0]]
+      .filter((id) => found.every((f) => f.has(id)))
+      .sort((a, b) => a - b);
+    render(ids);
+  }
+
+  input.addEventListener("input", search);
+})();